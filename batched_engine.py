@@ -0,0 +1,389 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+from games_and_strategies import actionTable, replicatorUpdateMaxScore
+from misc_globals import N, reputationFlat, occurringMorals, batchedDuelRandom
+from memmap_state import state_array
+
+import misc_globals
+import config
+import display_config
+import morals
+import safedirep
+import vectorized
+import implementation
+
+# A duel of focal and chosen only reads and writes the state of players within
+# (Chebyshev) distance 2 of focal. Two duels whose such neighborhoods do not
+# overlap commute, so they can be played at the same time.
+# We draw a window of random duels (with all their random numbers) and play
+# all duels that do not overlap with any earlier duel of the window at once;
+# the remaining duels stay pending, in order, and are considered first in the
+# next window. The duels are thus played in an order that is equivalent to
+# playing them one after another in the order they were drawn.
+# Like vectorized, the kernels below look up the strategies and the neighbor
+# tables in misc_globals when called, so that the replica engine can use them
+# for the stacked state of all its replicas.
+
+# The number of duels considered at once
+windowSize = max(16, (N * N) // 64)
+
+# Offsets of the players within distance 2 of a focal player
+footprintX, footprintY = [
+    offsets.reshape(1, -1) for offsets in np.mgrid[-2:3, -2:3]
+]
+
+# For each player, the first duel of the current window whose neighborhood
+# contains the player (windowSize + 1 if none)
+unclaimed = windowSize + 1
+claims = state_array("claims", (N * N,), int, unclaimed)
+
+# The pending duels: focals, slots of chosen, random numbers for the replicator
+# update, replay orders (of focal and chosen) and random numbers for contacts
+# with heaven and hell
+pendingDuels = (
+    np.zeros(0, int),
+    np.zeros(0, int),
+    np.zeros(0, float),
+    np.zeros((0, 2, 8), int),
+    np.zeros((0, 4), float),
+)
+
+# Pseudo-slots for contacts with heaven and hell in duels (as in implementation)
+heavenSlot = 8
+hellSlot = 9
+
+
+# Play at most maxDuels duels; returns the number of played duels
+# and the number of duels that changed a strategy
+def run_duels(maxDuels):
+    global pendingDuels
+
+    if config.counterBasedRandom:
+        # draw no duel beyond the next maxDuels ones, so that whenever maxDuels is
+        # reached, exactly the duels of the sequential engine have been played
+        count = min(windowSize, maxDuels) - len(pendingDuels[0])
+        newDuels = misc_globals.duelRandom.duels(count)
+    else:
+        newDuels = draw_duels(windowSize - len(pendingDuels[0]))
+    window = [np.concatenate(fields) for fields in zip(pendingDuels, newDuels)]
+
+    selected = np.flatnonzero(independent_duels(window[0]))[:maxDuels]
+    remaining = np.ones(len(window[0]), bool)
+    remaining[selected] = False
+    pendingDuels = tuple(field[remaining] for field in window)
+
+    takenOver, oldStrategies = play_duels(*[field[selected] for field in window])
+    for oldStrategy, newStrategy in zip(
+        oldStrategies.tolist(), misc_globals.strategiesFlat[takenOver].tolist()
+    ):
+        implementation.record_takeover(oldStrategy, newStrategy)
+    return len(selected), len(takenOver)
+
+
+# Draw count random duels
+def draw_duels(count, rand=batchedDuelRandom):
+    return (
+        rand.integers(0, N * N, count),
+        rand.integers(0, 8, count),
+        rand.random(count),
+        np.argsort(rand.random((count, 2, 8)), axis=2),
+        rand.random((count, 4)),
+    )
+
+
+# Determine which duels do not overlap with an earlier duel of the window
+def independent_duels(focals):
+    xs, ys = np.divmod(focals, N)
+    footprints = ((xs[:, None] + footprintX) % N) * N + (ys[:, None] + footprintY) % N
+    return unclaimed_footprints(footprints)
+
+
+# Determine which duels share no player of their footprints (the rows of
+# footprints) with an earlier duel
+def unclaimed_footprints(footprints):
+    duels = np.arange(len(footprints))
+    np.minimum.at(claims, footprints.ravel(), np.repeat(duels, footprints.shape[1]))
+    independent = claims[footprints].min(axis=1) == duels
+    claims[footprints] = unclaimed
+    return independent
+
+
+# Play the given (non-overlapping) duels, see implementation.duel_with_strategy_update;
+# returns the focal players that adopted a new strategy and their old strategies
+def play_duels(focals, chosenSlots, replicatorRandoms, orders, contactRandoms):
+    strategiesFlat = misc_globals.strategiesFlat
+    neighborTable = misc_globals.neighborTable
+    reverseSlotTable = misc_globals.reverseSlotTable
+    count = len(focals)
+    chosens = neighborTable[focals, chosenSlots]
+
+    # focals and chosens are handled together as players; partners[i] is the
+    # other player of the duel, the partnerSlots[i]-th neighbor of players[i]
+    players = np.concatenate((focals, chosens))
+    partners = np.concatenate((chosens, focals))
+    partnerSlots = np.concatenate((chosenSlots, reverseSlotTable[focals, chosenSlots]))
+
+    # Determine actions and payoff
+    actions = np.zeros((2 * count, 10), int)
+    actions[:, :8] = implementation.edgeActionsFlat[players]
+    vsActions = implementation.edgeActionsByEdge[
+        implementation.reverseEdgeTable[players]
+    ]
+    focalPayoffs = implementation.scoresFlat[focals]
+    chosenPayoffs = implementation.scoresFlat[chosens]
+
+    # Store actions in lastAction
+    if display_config.showLastActionMatrix:
+        lastActionFlat = implementation.lastActionFlat
+        expandedIndexTable = misc_globals.expandedIndexTable
+        lastActionFlat[expandedIndexTable[players]] = actions[:, :8]
+        lastActionFlat[
+            expandedIndexTable[neighborTable[players], reverseSlotTable[players]]
+        ] = vsActions
+
+    # (Potential) strategy updates
+    diff = chosenPayoffs - focalPayoffs
+    if config.deterministicStrategyUpdates:
+        probForChosen = (diff > 0) * 1.0
+    else:
+        probForChosen = np.where(diff <= 0, 0, diff) / replicatorUpdateMaxScore
+    oldStrategies = strategiesFlat[focals]
+    newStrategies = strategiesFlat[chosens]
+    takeover = (
+        (probForChosen > 0)
+        & (replicatorRandoms <= probForChosen)
+        & (oldStrategies != newStrategies)
+    )
+    strategiesFlat[focals[takeover]] = newStrategies[takeover]
+
+    # with a certain probability, focal and chosen additionally meet heaven/hell
+    meetsHeaven = meetsHell = np.zeros(2 * count, bool)
+    if config.supernaturalMode:
+        if config.heavenHellTogether:
+            meetsHeaven = np.concatenate(
+                (
+                    contactRandoms[:, 0] <= config.heavenContactProbFocal,
+                    contactRandoms[:, 1] <= config.heavenContactProbChosen,
+                )
+            )
+            meetsHell = meetsHeaven
+        else:
+            meetsHeaven = np.concatenate(
+                (
+                    contactRandoms[:, 0] <= config.heavenContactProbFocal,
+                    contactRandoms[:, 2] <= config.heavenContactProbChosen,
+                )
+            )
+            meetsHell = np.concatenate(
+                (
+                    contactRandoms[:, 1] <= config.hellContactProbFocal,
+                    contactRandoms[:, 3] <= config.hellContactProbChosen,
+                )
+            )
+
+    # actions against heaven and hell (played with the possibly updated strategy)
+    strategyActions = actionTable[strategiesFlat[players]]
+    actions[:, heavenSlot] = strategyActions[:, 1]
+    actions[:, hellSlot] = strategyActions[:, 0]
+
+    # reputation update: again 'simulate' the played duels
+    playerOrders = np.concatenate((orders[:, 0], orders[:, 1]))
+    for moral in occurringMorals:
+        newReputations = replay_duels(
+            moral,
+            players,
+            vectorized.get_reputations(moral, players, partners, partnerSlots),
+            actions,
+            playerOrders,
+            meetsHeaven,
+            meetsHell,
+        )
+        reputationFlat[moral][players] = newReputations
+        if moral in safedirep.againstPlayerBits:
+            safedirep.visualMatrixFlat[moral][
+                misc_globals.expandedCenterIndex[players]
+            ] = newReputations
+            store_played_actions(moral, players, actions, vsActions)
+
+    update_caches(players)
+    return focals[takeover], oldStrategies[takeover]
+
+
+# Replay the duels of the players against their neighbors (in the given orders)
+# and against heaven and hell to update their reputations reps in moral
+def replay_duels(moral, players, reps, actions, orders, meetsHeaven, meetsHell):
+    newReputations = morals.newReputationVectorized[moral]
+    neighborTable = misc_globals.neighborTable
+    rows = np.arange(len(players))
+    for step in range(8):
+        slots = orders[:, step]
+        reps = newReputations(
+            players,
+            moral,
+            reps,
+            vectorized.get_reputations(
+                moral, neighborTable[players, slots], players, slots
+            ),
+            actions[rows, slots],
+        )
+    if np.any(meetsHeaven):
+        reps[meetsHeaven] = newReputations(
+            players[meetsHeaven],
+            moral,
+            reps[meetsHeaven],
+            np.ones(np.count_nonzero(meetsHeaven), int),
+            actions[meetsHeaven, heavenSlot],
+        )
+    if np.any(meetsHell):
+        reps[meetsHell] = newReputations(
+            players[meetsHell],
+            moral,
+            reps[meetsHell],
+            np.zeros(np.count_nonzero(meetsHell), int),
+            actions[meetsHell, hellSlot],
+        )
+    return reps
+
+
+# Remember the actions played between the players and their neighbors for direct reciprocity
+def store_played_actions(moral, players, actions, vsActions):
+    neighbors = misc_globals.neighborTable[players]
+    owners = np.broadcast_to(players[:, None], neighbors.shape)
+    slots = np.broadcast_to(np.arange(8), neighbors.shape)
+    stored = neighbors % (N * N) != vectorized.polarizingPlayer
+    safedirep.store_actions(
+        moral,
+        neighbors[stored],
+        misc_globals.reverseSlotTable[players][stored],
+        actions[:, :8][stored],
+    )
+    safedirep.store_actions(moral, owners[stored], slots[stored], vsActions[stored])
+
+
+# Recompute the cached actions on all edges at the given players
+# and the cached scores of the players and their neighbors
+def update_caches(players):
+    neighbors = misc_globals.neighborTable[players].ravel()
+    edgePlayers = np.concatenate((np.repeat(players, 8), neighbors))
+    edgeSlots = np.concatenate(
+        (
+            np.tile(np.arange(8), len(players)),
+            misc_globals.reverseSlotTable[players].ravel(),
+        )
+    )
+    implementation.edgeActionsFlat[edgePlayers, edgeSlots] = vectorized.get_actions(
+        edgePlayers, edgeSlots
+    )
+
+    scored = np.concatenate((players, neighbors))
+    implementation.scoresFlat[scored] = implementation.cached_scores(scored)
+
+
+# Play duels without strategy updates between players1[i] and players2[i]
+# (distinct players that need not be neighbors), see
+# implementation.duel_without_strategy_update
+def play_duels_without_strategy_update(players1, players2, polarizationSeed=False):
+    count = len(players1)
+
+    # both players of each duel are handled together as players; players[i]
+    # is the slots[i]-th neighbor of partners[i] (and vice versa for partnerSlots)
+    players = np.concatenate((players1, players2))
+    partners = np.concatenate((players2, players1))
+    slots = vectorized.neighbor_slots(partners, players)
+    partnerSlots = np.concatenate((slots[count:], slots[:count]))
+    actions = vectorized.get_actions(players, partnerSlots, partners)
+
+    # Reputation update (for all morals)
+    for moral in occurringMorals:
+        oldReputations = vectorized.get_reputations(moral, players, partners, slots)
+
+        # Use artificial polarized reputation of player1 (in the very first duel)
+        if polarizationSeed:
+            oldReputations[:count] = (
+                0 if moral in morals.polarizationSeedScepticMorals else 1
+            )
+
+        newReputations = morals.newReputationVectorized[moral](
+            players,
+            moral,
+            oldReputations,
+            np.concatenate((oldReputations[count:], oldReputations[:count])),
+            actions,
+        )
+        reputationFlat[moral][players] = newReputations
+        if moral in safedirep.againstPlayerBits:
+            safedirep.visualMatrixFlat[moral][
+                misc_globals.expandedCenterIndex[players]
+            ] = newReputations
+
+
+# The number of partners of a player in reputation initialization duels: its
+# neighbors (local), or all other players (global)
+repInitPartnerRange = 8 if config.repInitMode == config.repInitModeLocal else N * N - 1
+
+
+# Draw count random pairs of players for reputation initialization
+def draw_rep_init_pairs(count, rand=batchedDuelRandom):
+    players1 = rand.integers(0, N * N, count)
+    return rep_init_pairs(players1, rand.integers(0, repInitPartnerRange, count))
+
+
+# The pairs of players1 and their partners given by partner numbers
+# in range(repInitPartnerRange)
+def rep_init_pairs(players1, partnerNumbers):
+    if config.repInitMode == config.repInitModeGlobal:
+        # random (non-local) pairs
+        players2 = (players1 + 1 + partnerNumbers) % (N * N)
+    else:
+        # local pairs (the tables of the first replica are those of a single lattice)
+        players2 = misc_globals.neighborTable[players1, partnerNumbers]
+    return players1, players2
+
+
+# "Initialize" reputation by playing the given number of random duels without
+# strategy updates, see implementation.init_reputation. A duel without strategy
+# update only reads and writes the state of its two players, so as for run_duels,
+# we draw a window of duels and play all duels at once that share no player with
+# an earlier duel of the window; this is equivalent to playing them one after
+# another in the order they were drawn.
+def init_reputation(rounds):
+    pending = (np.zeros(0, int), np.zeros(0, int))
+    drawn = 0
+    while drawn < rounds or len(pending[0]) > 0:
+        count = min(windowSize - len(pending[0]), rounds - drawn)
+        if implementation.repInitPolarizationSeed:
+            # the very first duel, with polarized reputation, is played alone
+            count = 1
+        drawn += count
+        if config.counterBasedRandom:
+            newPairs = rep_init_pairs(
+                *misc_globals.duelRandom.rep_init_duels(count, repInitPartnerRange)
+            )
+        else:
+            newPairs = draw_rep_init_pairs(count)
+        window = [np.concatenate(fields) for fields in zip(pending, newPairs)]
+
+        independent = unclaimed_footprints(np.stack(window, axis=1))
+        pending = tuple(field[~independent] for field in window)
+        play_duels_without_strategy_update(
+            *[field[independent] for field in window],
+            implementation.repInitPolarizationSeed,
+        )
+        implementation.repInitPolarizationSeed = False
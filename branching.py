@@ -0,0 +1,112 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import sys
+
+import numpy as np
+
+import config
+import misc_globals
+import batched_engine
+import stats as statistics
+from misc_globals import seed
+
+# Branching (--branches K): the prefix of a simulation, i.e., the initialization
+# and the first config.branchIteration iterations, is simulated only once. Then
+# the simulation forks K child processes, which share the state of the prefix
+# (copy-on-write) and continue it: branch b (1 <= b <= K) reseeds the random
+# number generators of the duels with the b-th child of the seed sequence of
+# the seed (so that its random numbers overlap neither those of the other
+# generators nor those of a run with another seed) and writes its statistics
+# and images to the subfolder branch-<b> of the output folder. The parent process
+# waits for all branches; its folder holds the configuration and the output of
+# the prefix.
+
+# Whether the branches are still to be forked
+pending = config.numberOfBranches > 1
+
+# The branch simulated by this process (0 in the parent)
+branch = 0
+
+
+# The seeds of the generators of the duels in the given branch: the duels,
+# the reputation noise, numpy's global generator and the batched engine
+def branch_seeds(b):
+    seedSequence = np.random.SeedSequence(seed).spawn(config.numberOfBranches)[b - 1]
+    return [int(value) for value in seedSequence.generate_state(4)]
+
+
+# Continue the duels with the random numbers of the given seeds
+def reseed(duelSeed, noiseSeed, numpySeed, batchedSeed):
+    misc_globals.duelSelectionRandom.seed(duelSeed)
+    if config.counterBasedRandom:
+        misc_globals.duelRandom.reseed(duelSeed)
+    misc_globals.reputationNoiseRandom.seed(noiseSeed)
+    misc_globals.batchedDuelRandom.bit_generator.state = np.random.default_rng(
+        batchedSeed
+    ).bit_generator.state
+    np.random.seed(numpySeed)
+    # the duels drawn in the prefix are not played
+    batched_engine.pendingDuels = tuple(
+        field[:0] for field in batched_engine.pendingDuels
+    )
+
+
+# Fork the branches; returns False in the branches, which continue the
+# simulation, and True in the parent, once all branches are done
+def fork_branches():
+    global pending, branch
+
+    pending = False
+    sys.stdout.flush()
+    children = {}
+    for b in range(1, config.numberOfBranches + 1):
+        pid = os.fork()
+        if pid == 0:
+            branch = b
+            start_branch()
+            return False
+        children[pid] = b
+
+    failed = []
+    while children:
+        pid, status = os.wait()
+        if status != 0:
+            failed.append(children[pid])
+        del children[pid]
+    if failed:
+        print("Branches " + ", ".join(map(str, sorted(failed))) + " failed!")
+        sys.exit(1)
+    return True
+
+
+def start_branch():
+    config.foldername = os.path.join(config.foldername, "branch-%d" % branch)
+    os.makedirs(config.foldername)
+    statistics.closeStatsFiles()
+    statistics.prepareStoreStats(config.foldername)
+    seeds = branch_seeds(branch)
+    reseed(*seeds)
+    print("Branch %d continues with duel seed %d" % (branch, seeds[0]))
+
+
+# End the process of a branch (once its simulation is done)
+def exit_branch():
+    if branch:
+        sys.stdout.flush()
+        os._exit(0)
@@ -16,7 +16,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import argparse
-import sys
+import hashlib
+import os
 from cmdline_parser import MyFormatter, PolarizingPlayerAction
 import strategy_init
 
@@ -69,6 +70,102 @@ argParser.add_argument(
     help="Terminates the simulation as soon as the first "
     + 'allC player touches the "boundary" of the world.',
 )
+argParser.add_argument(
+    "--engine",
+    choices=["sequential", "batched", "kinetic", "parallel"],
+    default="sequential",
+    help="How the duels of the main loop are executed: "
+    + '"sequential" plays one random duel after the other; "batched" draws '
+    + "a window of random duels and plays those whose neighborhoods do not "
+    + "overlap with any earlier pending duel at once, using vectorized "
+    + 'operations; "kinetic" keeps track of the duels that can change the '
+    + "state at all, plays only those and skips the others by advancing the "
+    + "iteration counter by a geometrically distributed number (fast when "
+    + "most of the lattice is quiescent). All produce the same distribution "
+    + "of trajectories, but not the same trajectory for a given seed. "
+    + "The sequential engine also plays the reputation initialization duel "
+    + "by duel (which takes long for large N), unless with --rng counter; the "
+    + "other engines play it in batches. "
+    + '"parallel" splits the lattice into bands of rows played by --workers '
+    + "processes on shared memory, alternating between the upper and the lower "
+    + "halves of all bands; its trajectories follow the same distribution "
+    + "only approximately, and since the bands confine where the duels of a "
+    + "round happen, they cannot be checked against the sequential engine "
+    + "with --rng counter (which it does not support); a parallel run is "
+    + "reproducible only with the same seed and number of workers. "
+    + "(default: %(default)s)",
+)
+argParser.add_argument(
+    "--workers",
+    default=os.cpu_count(),
+    type=int,
+    metavar="int",
+    help="The number of worker processes of the parallel engine (at most one "
+    + "per 8 rows of the lattice). The workers synchronize at least every "
+    + "--steps-between-refresh iterations, so choose that much larger than "
+    + "N*N/8 to let them run in parallel. (default: the number of CPUs)",
+)
+argParser.add_argument(
+    "--update-scheme",
+    choices=["asynchronous", "synchronous"],
+    default="asynchronous",
+    help='"asynchronous" (default) plays one duel of a random focal player '
+    + 'and a random neighbor per iteration; "synchronous" updates the whole '
+    + "lattice at once in generations: every player compares its score with "
+    + "that of a random neighbor and all players update their reputation "
+    + "from the duels against all neighbors. A generation counts as N*N "
+    + "iterations, and only whole generations are played (as many as fit "
+    + "into M iterations); --engine is ignored in this mode.",
+)
+argParser.add_argument(
+    "--replicas",
+    default=1,
+    type=int,
+    metavar="int",
+    help="The number of independent replicas of the simulation to run at once. "
+    + "With more than one replica, all replicas advance together by one duel "
+    + "per iteration using vectorized operations; replica r starts from the "
+    + "initial state of seed + r and draws its duels from its own random "
+    + "generator. Runs without GUI and writes a summary of all replicas to "
+    + "replicas.csv. (default: %(default)s)",
+)
+argParser.add_argument(
+    "--branches",
+    default=1,
+    type=int,
+    metavar="int",
+    help="The number of branches of the simulation. With more than one branch, "
+    + "the prefix of the simulation (the initialization and the first "
+    + "--branch-after iterations) is simulated once; then the simulation forks "
+    + "a child process per branch, sharing the state of the prefix. Branch b "
+    + "continues with the random numbers of the b-th child of the seed sequence "
+    + "of the seed and writes its results to the subfolder branch-<b> of the "
+    + "output folder. Requires --no-gui. "
+    + "(default: %(default)s)",
+)
+argParser.add_argument(
+    "--branch-after",
+    default=0,
+    type=int,
+    metavar="int",
+    help="The number of iterations simulated before the simulation branches "
+    + "(see --branches). (default: %(default)s)",
+)
+argParser.add_argument(
+    "--rng",
+    choices=["python", "numpy", "counter"],
+    default="python",
+    help="The random number generator for the duels of the sequential and "
+    + 'kinetic engines: "python" uses random.Random; "numpy" draws the random '
+    + "players, neighbors, shuffles and coin flips in bulk from a numpy "
+    + "generator, which is faster but gives different trajectories for the "
+    + 'same seed; "counter" derives the random numbers of the k-th duel from '
+    + "(seed, k) with a counter-based generator, so that the sequential and "
+    + "batched engines follow the same trajectory for the same seed (up to the "
+    + "duels the batched engine plays after the termination condition is met; "
+    + "not available for the kinetic and parallel engines, so their runs "
+    + "cannot be reproduced by the sequential engine). (default: %(default)s)",
+)
 argParser.add_argument(
     "--seed",
     default=None,
@@ -194,6 +291,16 @@ argParser.add_argument(
     + "provide an initializing script here. For an example "
     + 'of such script, see "initial-strategies-demo.py"',
 )
+argParser.add_argument(
+    "--initial-strategies-file",
+    default=None,
+    metavar="file",
+    help="Read the initial strategies from the given file instead of using "
+    + "--initial-strategies: either a .npy file with an N x N integer array of "
+    + "strategy ids (which is memory-mapped) or a PNG image with N x N pixels "
+    + "in the colors of the strategies in --strategy-colors "
+    + "(default: %(default)s)",
+)
 argParser.add_argument(
     "--rep-init-rounds",
     default=None,
@@ -235,6 +342,29 @@ argParser.add_argument(
     "a difference in observed old reputation is enforced, <>"
     + "which can serve as a seed of polarization of reputation.",
 )
+argParser.add_argument(
+    "--memmap-state",
+    default=False,
+    const=True,
+    action="store_const",
+    help="Back the state arrays (strategies, reputations, the bits and "
+    + "histories of the morals, ...), the neighbor tables and the work arrays "
+    + "of the engines with memory-mapped .npy files in the "
+    + "subfolder state of the output folder instead of memory, for lattices "
+    + "larger than the memory. Other processes can load the files with "
+    + 'numpy.load(file, mmap_mode="r") to inspect the running simulation. '
+    + "Supports neither replicas, branches nor the parallel engine.",
+)
+argParser.add_argument(
+    "--init-cache",
+    default=None,
+    metavar="cacheFolder",
+    help="Cache the initialized state (the initial strategies and the "
+    + "reputations after the reputation initialization) in cacheFolder, keyed "
+    + "by a hash of the parameters affecting it, the seed and the source code "
+    + "of the simulator. Runs finding their initialized state there load it "
+    + "instead of repeating the initialization. (default: %(default)s)",
+)
 argParser.add_argument(
     "--polarizing-player",
     default=None,
@@ -279,6 +409,24 @@ argParser.add_argument(
     + "Default is current date and time.<> "
     + "Note that RepEvol will exit if the given folder already exists.",
 )
+argParser.add_argument(
+    "--store",
+    default=None,
+    metavar="storeFolder",
+    help="Keep the results in a content-addressed store: they are written to "
+    + "a subfolder of storeFolder named by a hash of the parameters, the seed "
+    + "and the source code of the simulator (the output folder, if given, "
+    + "links to it). A run whose results are already stored is not repeated "
+    + "(see --store-hit). (default: %(default)s)",
+)
+argParser.add_argument(
+    "--store-hit",
+    default="link",
+    choices=["link", "fail"],
+    help='What to do if the results are already stored: "link" links the '
+    + 'output folder (if given) to them, "fail" exits with an error. '
+    + "(default: %(default)s)",
+)
 argParser.add_argument(
     "-c",
     "--strategy-colors",
@@ -306,6 +454,15 @@ argParser.add_argument(
     action="store_const",
     help="Store the content of the GUI as images.",
 )
+argParser.add_argument(
+    "--no-images",
+    default=False,
+    const=True,
+    action="store_const",
+    help="Do not store the matrices as images. Together with --no-gui (and "
+    + "without --store-whole-pictures), the simulation runs without plotting "
+    + "and matplotlib is not even imported, which speeds up the startup.",
+)
 
 # GUI Settings
 argParser.add_argument(
@@ -349,8 +506,65 @@ argParser.add_argument(
 )
 
 
-args = argParser.parse_args()
+# The arguments of the simulation, set by set_args before the other simulator
+# modules are imported (they read args when they are imported)
+commandline = None
+args = None
+
+
+# The namespace of the given command line arguments (a list of strings);
+# exits with a message if they are invalid
+def parse(arguments):
+    parsed = argParser.parse_args(arguments)
+
+    # the replica engine has its own engine, random numbers and update scheme
+    if parsed.replicas > 1:
+        for option in ["engine", "rng", "update_scheme"]:
+            if getattr(parsed, option) != argParser.get_default(option):
+                argParser.error(
+                    "--%s is not supported with --replicas" % option.replace("_", "-")
+                )
+    return parsed
+
+
+# Make the given arguments and their namespace (see parse) the arguments of the
+# simulation
+def set_args(arguments, parsed):
+    global commandline, args
+    commandline = list(arguments)
+    args = parsed
 
 
 def get_commandline():
-    return " ".join(sys.argv[1:])
+    return " ".join(commandline)
+
+
+# The values of the given arguments (a namespace as args), one line "name = value"
+# per argument, sorted by name
+def parameter_lines(arguments, keyLen=40):
+    values = arguments.__dict__
+    return [str(arg).ljust(keyLen) + " = " + str(values[arg]) for arg in sorted(values)]
+
+
+# The parameter lines of the given arguments that determine the results of a run,
+# i.e., without where the results are written to (and the number of workers,
+# unless the parallel engine uses them)
+def result_parameter_lines(arguments):
+    values = dict(
+        arguments.__dict__,
+        output_folder=None,
+        store=None,
+        store_hit=None,
+        init_cache=None,
+        memmap_state=None,
+    )
+    if values["engine"] != "parallel":
+        values["workers"] = None
+    # the contents of the initial strategies file, not only its name, matter
+    layoutFileName = values["initial_strategies_file"]
+    if layoutFileName is not None and os.path.isfile(layoutFileName):
+        with open(layoutFileName, "rb") as layoutFile:
+            values["initial_strategies_file"] += " (sha256 {})".format(
+                hashlib.sha256(layoutFile.read()).hexdigest()
+            )
+    return parameter_lines(argparse.Namespace(**values))
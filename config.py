@@ -17,13 +17,16 @@
 
 import numpy as np
 import display_config
-from misc_globals import strategies, reputation, N
+from misc_globals import strategies, reputation, reputationFlat, N
 from misc_globals import occurringStrategiesNames, occurringStrategies
 from misc_globals import occurringMorals, occurringInterestingMorals
 from misc_globals import seed
 import games_and_strategies
 import morals
-from cmdline_args import args, get_commandline
+from cmdline_args import args, get_commandline, parameter_lines
+import result_store
+import init_cache
+import memmap_state
 import sys
 
 # python3 support - this works regardless of python version.
@@ -57,7 +60,9 @@ def store_configuration(strategyLabels):
 
     global foldername
 
-    if args.output_folder is None:
+    if result_store.storeFolder is not None:
+        foldername = result_store.incompleteFolder
+    elif args.output_folder is None:
         timestamp = datetime.now()
         foldername = timestamp.strftime("%Y-%m-%d__%H-%M-%S.%f")
     else:
@@ -69,6 +74,7 @@ def store_configuration(strategyLabels):
         sys.exit(2)
 
     os.makedirs(foldername)
+    memmap_state.move_to(foldername)
     n = os.linesep
 
     occurringMoralNames = {}
@@ -76,7 +82,6 @@ def store_configuration(strategyLabels):
         occurringMoralNames[moral] = morals.moralNames[moral]
 
     keyLen = 40
-    cmdlineArgs = args.__dict__
 
     # Store the used functions in textfile
     configfile = open(foldername + os.sep + "config.txt", "w")
@@ -85,8 +90,8 @@ def store_configuration(strategyLabels):
     configfile.write("Parameters:" + n)
 
     # Write cmdline args
-    for arg in sorted(cmdlineArgs.keys()):
-        configfile.write(str(arg).ljust(keyLen) + " = " + str(cmdlineArgs[arg]) + n)
+    for line in parameter_lines(args, keyLen):
+        configfile.write(line + n)
 
     configfile.write(n + n + "Hardcoded Parameters:" + n)
     configfile.write("Game Matrix: " + n + str(payoffs) + n)
@@ -115,11 +120,14 @@ def store_configuration(strategyLabels):
 
 import strategy_init
 
-initializeStrategies = strategy_init.scenarios[args.initial_strategies]
+if args.initial_strategies_file is not None:
+    initializeStrategies = strategy_init.strategies_from_file
+else:
+    initializeStrategies = strategy_init.scenarios[args.initial_strategies]
 if initializeStrategies is None:
     print("Your initial strategies have not been implemented yet!")
     exit(17)
-else:
+elif not init_cache.load_strategies():
     initializeStrategies()
 
 disableReputationInitializationRounds = args.no_rep_init
@@ -137,13 +145,11 @@ else:
 
 
 # Compute occurring strategies
-# find actually occurring strategies
-for i in xrange(N):
-    for j in xrange(N):
-        occurringStrategies.add(strategies[i, j])
-        occurringStrategiesNames[strategies[i, j]] = games_and_strategies.strategyName[
-            strategies[i, j]
-        ]
+# find actually occurring strategies (in the order of their first occurrence)
+strategyValues, firstOccurrences = np.unique(strategies, return_index=True)
+for strategy in strategyValues[np.argsort(firstOccurrences)].tolist():
+    occurringStrategies.add(strategy)
+    occurringStrategiesNames[strategy] = games_and_strategies.strategyName[strategy]
 
 for strategy in occurringStrategiesNames.keys():
     moral = games_and_strategies.strategyMoral[strategy]
@@ -195,6 +201,7 @@ if len(diffMorals) < 2:
 # init reputation
 for moral in occurringMorals:
     reputation[moral] = morals.initMoral[moral](moral, strategies)
+    reputationFlat[moral] = reputation[moral].reshape(-1)
 
 
 repInitModeLocal = 0
@@ -203,8 +210,9 @@ repInitMode = repInitModeLocal if args.rep_init_type == "local" else repInitMode
 
 
 # Re-initialize numpy random, such that number of uses for initial state creation
-# does not affect uses in implementation
-np.random.seed(seed + 42)
+# does not affect uses in implementation (also done by the replica engine)
+mainLoopNumpySeed = seed + 42
+np.random.seed(mainLoopNumpySeed)
 
 
 # _  _ ____ ____ _  _ ____ _  _    ____ _  _ ___     _  _ ____ _    _
@@ -259,5 +267,74 @@ repUpdateMode = repUpdateAll if args.rep_update_mode == "all" else repUpdateFoca
 # Strategy update mode
 deterministicStrategyUpdates = args.deterministic_strategy_updates
 
+# Engine executing the duels of the main loop
+engineSequential = 0
+engineBatched = 1
+engineKinetic = 2
+engineParallel = 3
+engine = {
+    "sequential": engineSequential,
+    "batched": engineBatched,
+    "kinetic": engineKinetic,
+    "parallel": engineParallel,
+}[args.engine]
+
+# Number of worker processes of the parallel engine
+numberOfWorkers = args.workers
+if numberOfWorkers < 1:
+    print("The number of workers must be positive!")
+    sys.exit(1)
+
+# Counter-based random numbers for the duels (see rng.CounterRandom)
+counterBasedRandom = args.rng == "counter"
+if counterBasedRandom and engine in (engineKinetic, engineParallel):
+    print("The %s engine does not support counter-based random numbers!" % args.engine)
+    sys.exit(1)
+
+# Update scheme (asynchronous: one duel per iteration, synchronous: whole generations)
+updateSchemeAsynchronous = 0
+updateSchemeSynchronous = 1
+updateScheme = (
+    updateSchemeSynchronous
+    if args.update_scheme == "synchronous"
+    else updateSchemeAsynchronous
+)
+if updateScheme == updateSchemeSynchronous and args.M < N * N:
+    print("Synchronous updates need M >= N * N (one generation)!")
+    sys.exit(1)
+
+# Number of replicas simulated at once by the replica engine
+numberOfReplicas = args.replicas
+if numberOfReplicas < 1:
+    print("The number of replicas must be positive!")
+    sys.exit(1)
+if numberOfReplicas > 1 and init_cache.cacheFolder is not None:
+    print("The replica engine does not support the cache of initialized states!")
+    sys.exit(1)
+if memmap_state.mapState and (numberOfReplicas > 1 or engine == engineParallel):
+    print("Memory-mapped state supports neither replicas nor the parallel engine!")
+    sys.exit(1)
+
+# Number of branches forked after the first branchIteration iterations
+# (see branching.py)
+numberOfBranches = args.branches
+branchIteration = args.branch_after
+if numberOfBranches < 1:
+    print("The number of branches must be positive!")
+    sys.exit(1)
+if numberOfBranches > 1:
+    if not args.no_gui:
+        print("Branching requires --no-gui!")
+        sys.exit(1)
+    if numberOfReplicas > 1 or engine == engineParallel:
+        print("Branching supports neither replicas nor the parallel engine!")
+        sys.exit(1)
+    if memmap_state.mapState:
+        print("Branching does not support memory-mapped state!")
+        sys.exit(1)
+    if not 0 <= branchIteration < args.M:
+        print("The simulation must branch after 0 to M - 1 iterations!")
+        sys.exit(1)
+
 # Polarizing player
 polarizingPlayer = args.polarizing_player
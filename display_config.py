@@ -42,7 +42,7 @@ showInFirstRow = args.first_row
 storeWholePictures = args.store_whole_pictures
 outputDPI = 75
 # store matrices as images every stepsBetweenStoresImages steps
-storeMatrices = True
+storeMatrices = not args.no_images
 
 # Select strategy colors
 strategyColor = strategies.strategyColorMap[args.strategy_colors]
@@ -51,11 +51,14 @@ strategyColor = strategies.strategyColorMap[args.strategy_colors]
 # Moral to show reputation for in GUI
 guiMoral = -1
 
-# Disable GUI
-completelyDisableGUI = args.no_gui
+# Disable GUI (the replica engine has none)
+completelyDisableGUI = args.no_gui or args.replicas > 1
 
-showStatsInSecondRow = not (args.no_gui_stats or args.no_gui)
+showStatsInSecondRow = not (args.no_gui_stats or completelyDisableGUI)
 
-showLastActionMatrix = not args.no_gui and args.show_last_actions
+showLastActionMatrix = not completelyDisableGUI and args.show_last_actions
+
+# Whether anything is plotted at all (otherwise, matplotlib is not needed)
+usePlots = not completelyDisableGUI or storeMatrices or storeWholePictures
 
 gui_backend = args.gui_backend
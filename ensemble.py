@@ -0,0 +1,138 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import simulator
+
+# Run a configuration for a range of seeds, spread over worker processes:
+#   python ensemble.py --seeds 0 100 [--jobs J] [-o folder] -- <simulator options>
+# Each run writes its usual output to the subfolder seed-<seed> of the ensemble
+# folder (and its console output to seed-<seed>.log); the final strategy counts
+# and the termination reasons of all runs are collected in ensemble.csv.
+
+csvSep = ";"
+
+argParser = argparse.ArgumentParser(
+    description="Run the RepEvol simulator for a range of seeds",
+    epilog="All arguments after -- are passed to every run (see main.py -h).",
+)
+argParser.add_argument(
+    "--seeds",
+    nargs=2,
+    type=int,
+    required=True,
+    metavar=("first", "end"),
+    help="Run the seeds first, ..., end - 1.",
+)
+argParser.add_argument(
+    "--jobs",
+    default=os.cpu_count(),
+    type=int,
+    metavar="int",
+    help="The number of worker processes (default: the number of CPUs)",
+)
+argParser.add_argument(
+    "-o",
+    "--output-folder",
+    default=None,
+    metavar="outputFolder",
+    help="The folder of the ensemble (default: current date and time)",
+)
+
+
+# Run the simulation with the given seed, writing its output to folder;
+# returns the seed, the number of iterations, the termination reason and the
+# final number of players per strategy name
+def run_seed(arguments, seed, folder):
+    with open(folder + ".log", "w") as log, redirect_stdout(log):
+        result = simulator.run_simulation(
+            arguments + ["--seed", str(seed), "-o", folder], store=True
+        )
+    return seed, result.iterations, result.terminationReason, result.strategyCounts
+
+
+# Call function for the given runs (argument lists) on jobs worker processes,
+# reporting their progress; returns the results (in the order of the runs)
+def run_all(function, runs, jobs):
+    results = [None] * len(runs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(function, *run): i for i, run in enumerate(runs)}
+        for done, future in enumerate(as_completed(futures)):
+            results[futures[future]] = future.result()
+            print("Finished run %d of %d" % (done + 1, len(runs)))
+    return results
+
+
+def store_summary(filename, results):
+    strategyNames = []
+    for _, _, _, strategyCounts in results:
+        strategyNames += [name for name in strategyCounts if name not in strategyNames]
+    summaryFile = open(filename, "w")
+    summaryFile.write(
+        csvSep.join(
+            ["Seed", "#iterations", "Termination"]
+            + ["#players " + name for name in strategyNames]
+        )
+        + os.linesep
+    )
+    for seed, iterations, reason, strategyCounts in results:
+        summaryFile.write(
+            csvSep.join(
+                [str(seed), str(iterations), reason]
+                + [str(strategyCounts.get(name, 0)) for name in strategyNames]
+            )
+            + os.linesep
+        )
+    summaryFile.close()
+
+
+def main(argv):
+    if "--" in argv:
+        arguments = argv[argv.index("--") + 1 :]
+        argv = argv[: argv.index("--")]
+    else:
+        arguments = []
+    args = argParser.parse_args(argv)
+    if args.jobs < 1:
+        print("The number of jobs must be positive!")
+        sys.exit(1)
+
+    folder = args.output_folder
+    if folder is None:
+        folder = datetime.now().strftime("%Y-%m-%d__%H-%M-%S.%f")
+    if os.path.exists(folder):
+        print("Folder " + str(folder) + " already exists! Exiting.")
+        sys.exit(2)
+    os.makedirs(folder)
+    print("Writing results to " + os.path.abspath(folder) + ".")
+
+    runs = [
+        (arguments, seed, os.path.join(folder, "seed-%d" % seed))
+        for seed in range(*args.seeds)
+    ]
+    results = run_all(run_seed, runs, args.jobs)
+    store_summary(os.path.join(folder, "ensemble.csv"), results)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -166,3 +166,25 @@ def action(strategy, R_you):
         return cooperate
     elif strategy in discriminatorStrategies:
         return cooperate if R_you >= 0.5 else defect
+
+
+# Dense lookup tables compiled from strategyMoral, action and payoffs above.
+# actionTable[strategy, repBit] is the action a player with the given strategy
+# plays against someone whose reputation (in the player's moral) is bad (repBit = 0)
+# or good (repBit = 1); moralTable[strategy] is the moral of the strategy and
+# payoffTable[a1, a2] the payoff of a player playing a1 against a2.
+# Row 0 of actionTable/moralTable is unused (strategy ids start at 1).
+numberOfStrategyIds = max(strategyName.keys()) + 1
+actionTable = np.zeros((numberOfStrategyIds, 2), int)
+moralTable = np.zeros(numberOfStrategyIds, int)
+for _strategy in strategyName.keys():
+    actionTable[_strategy, 0] = action(_strategy, 0)
+    actionTable[_strategy, 1] = action(_strategy, 1)
+    moralTable[_strategy] = strategyMoral[_strategy]
+payoffTable = np.array(payoffs, float)
+
+# Nested-list copies of the tables for the scalar code paths;
+# indexing python lists is several times faster than indexing numpy arrays with scalars.
+actionList = actionTable.tolist()
+moralList = moralTable.tolist()
+payoffList = payoffTable.tolist()
@@ -80,6 +80,14 @@ def reputation_diff_matrix(moral1, moral2):
     return 7 * reputation[moral1] + 3 * reputation[moral2]
 
 
+# A matrix to show or store as image; the color maps normalize small integer
+# and single precision matrices (like the compact state arrays) in single
+# precision, so we pass them in double precision to get the same colors
+# whatever the dtype
+def as_image(matrix):
+    return np.asarray(matrix, float)
+
+
 def _after(arg):
     arg.updateUI()
 
@@ -206,7 +214,7 @@ class PlotUI:
             self.strategiesPlot = plt.axes([left, bottom, width, height])
             self.strategiesPlot.set_title("Strategies")
             self.strategiesImage = plt.imshow(
-                strategies,
+                as_image(strategies),
                 vmin=minStrategyValue,
                 vmax=maxStrategyValue,
                 interpolation="nearest",
@@ -231,7 +239,7 @@ class PlotUI:
                 )
                 self.reputationPlot.set_title("Reputation")
                 self.reputationImage = plt.imshow(
-                    reputation[display_config.guiMoral],
+                    as_image(reputation[display_config.guiMoral]),
                     vmin=0,
                     vmax=1,
                     interpolation="nearest",
@@ -254,7 +262,11 @@ class PlotUI:
                 )
                 self.reputationPlot.set_title("Reputation (Diff)")
                 self.reputationImage = plt.imshow(
-                    reputation_diff_matrix(config.diffMorals[0], config.diffMorals[1]),
+                    as_image(
+                        reputation_diff_matrix(
+                            config.diffMorals[0], config.diffMorals[1]
+                        )
+                    ),
                     vmin=0,
                     vmax=10,
                     interpolation="nearest",
@@ -310,7 +322,7 @@ class PlotUI:
                 )
                 self.safedirepPlot.set_title("Safedirep Map")
                 self.safedirepImage = plt.imshow(
-                    safedirep.visualMatrix[morals.safedirep],
+                    as_image(safedirep.visualMatrix[morals.safedirep]),
                     vmin=0,
                     vmax=3,
                     interpolation="nearest",
@@ -440,7 +452,7 @@ class PlotUI:
         maxStrategyValue = max(strategyName.keys())
         plt.imsave(
             fname=strategiesFilename,
-            arr=pltdata.strategies,
+            arr=as_image(pltdata.strategies),
             format="png",
             cmap=self.strategyColorMapDiscrete,
             vmin=minStrategyValue,
@@ -463,7 +475,7 @@ class PlotUI:
             )
             plt.imsave(
                 fname=reputationFilename,
-                arr=pltdata.reputation[moral],
+                arr=as_image(pltdata.reputation[moral]),
                 format="png",
                 cmap="hot",
                 vmin=0,
@@ -486,7 +498,7 @@ class PlotUI:
                 )
                 plt.imsave(
                     fname=safedirepFname,
-                    arr=pltdata.safedirepVisualMatrix[moral],
+                    arr=as_image(pltdata.safedirepVisualMatrix[moral]),
                     vmin=0,
                     vmax=3,
                     format="png",
@@ -512,7 +524,7 @@ class PlotUI:
         )
         plt.imsave(
             fname=filename,
-            arr=pltdata.lastAction,
+            arr=as_image(pltdata.lastAction),
             vmin=0,
             vmax=1,
             format="png",
@@ -555,7 +567,7 @@ class PlotUI:
         # We implicitly assume binary reputation here!
         plt.imsave(
             fname=diffFilename,
-            arr=pltdata.reputation_diff_matrix(moral1, moral2),
+            arr=as_image(pltdata.reputation_diff_matrix(moral1, moral2)),
             format="png",
             cmap=self.diffColorMap,
             vmin=0,
@@ -577,16 +589,18 @@ class PlotUI:
             display_config.matrices,
             display_config.matricesWithRepDiff,
         ]:
-            self.strategiesImage.set_array(pltdata.strategies)
+            self.strategiesImage.set_array(as_image(pltdata.strategies))
 
             if display_config.showInFirstRow == display_config.matrices:
                 self.reputationImage.set_array(
-                    pltdata.reputation[display_config.guiMoral]
+                    as_image(pltdata.reputation[display_config.guiMoral])
                 )
             elif display_config.showInFirstRow == display_config.matricesWithRepDiff:
                 self.reputationImage.set_array(
-                    pltdata.reputation_diff_matrix(
-                        config.diffMorals[0], config.diffMorals[1]
+                    as_image(
+                        pltdata.reputation_diff_matrix(
+                            config.diffMorals[0], config.diffMorals[1]
+                        )
                     )
                 )
 
@@ -595,7 +609,7 @@ class PlotUI:
 
             if morals.safedirep in occurringMorals:
                 self.safedirepImage.set_array(
-                    pltdata.safedirepVisualMatrix[morals.safedirep]
+                    as_image(pltdata.safedirepVisualMatrix[morals.safedirep])
                 )
 
         if display_config.showStatsInSecondRow:
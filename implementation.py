@@ -19,23 +19,32 @@ import numpy as np
 import time, sys
 from cmdline_args import args
 
-from games_and_strategies import payoffs, strategyMoral, replicatorUpdateMaxScore
+from games_and_strategies import (
+    actionList,
+    moralList,
+    payoffList,
+    replicatorUpdateMaxScore,
+)
 
 from misc_globals import (
     strategies,
+    strategiesFlat,
     reputation,
+    reputationFlat,
     N,
     M,
-    bernoulli,
+    occurringStrategies,
     occurringStrategiesNames,
-    neighbor_offsets,
     neighbor_offsets_index,
+    player_index,
+    player_coordinates,
     occurringMorals,
-    duelSelectionRandom,
+    duelRandom,
     HEAVEN,
     HELL,
 )
 
+import misc_globals
 import config
 import morals
 import display_config
@@ -44,6 +53,16 @@ import games_and_strategies
 import stats as statistics
 import safedirep
 import smart_mafia
+import vectorized
+import batched_engine
+import kinetic
+import parallel_engine
+import synchronous
+import result_store
+import branching
+import init_cache
+import memmap_state
+from memmap_state import state_array
 
 # python3 support - this works regardless of python version.
 try:
@@ -51,8 +70,10 @@ try:
 except NameError:
     xrange = range
 
-# The polarizing player
-polarizingPlayer = config.polarizingPlayer
+# The polarizing player (as flat index)
+polarizingPlayer = (
+    None if config.polarizingPlayer is None else player_index(*config.polarizingPlayer)
+)
 
 # Seed for polarization
 repInitPolarizationSeed = args.polarization_seed
@@ -60,6 +81,9 @@ repInitPolarizationSeed = args.polarization_seed
 # The current iteration
 iteration = 0
 
+# Why the simulation terminated before M iterations ("" if it did not)
+terminationReason = ""
+
 # The number of strategies occurring
 numberOfOccurringStrategies = len(occurringStrategiesNames)
 
@@ -68,16 +92,111 @@ currentWelfare = np.zeros((N, N), float)
 
 # last action
 if display_config.showLastActionMatrix:
-    lastAction = np.zeros((3 * N, 3 * N), int) - 5
+    lastAction = state_array(
+        "lastAction", (3 * N, 3 * N), misc_globals.stateInt, -5
+    )
     for x in xrange(N):
         for y in xrange(N):
             lastAction[3 * x + 1, 3 * y + 1] = 5
+    lastActionFlat = lastAction.reshape(-1)
+
+# The list versions of the neighbor tables of misc_globals,
+# bound by use_scalar_tables before a scalar code path is used
+neighborLists = None
+reverseSlotLists = None
+expandedIndexLists = None
+expandedCenterList = None
+
+# The slots of the neighbors of a player;
+# neighbor k of player p is neighborLists[p][k]
+neighborSlots = list(range(8))
+
+# Pseudo-slots for contacts with heaven and hell in duels
+heavenSlot = 8
+hellSlot = 9
+
+# Scratch buffers of the duel kernel, reused for every duel.
+# The actions are indexed by slot (including heavenSlot and hellSlot),
+# the orders hold the (shuffled) slots in which the duels are replayed.
+focalActions = [0] * 10
+vsFocalActions = [0] * 10
+chosenActions = [0] * 10
+vsChosenActions = [0] * 10
+focalsOrder = list(neighborSlots)
+chosenOrder = list(neighborSlots)
+
+# The action of every player against each of its neighbors:
+# edgeActions[x, y, k] is the action of (x, y) against its k-th neighbor.
+# It is built at the start of the main loop and from then on updated incrementally
+# whenever a strategy, a reputation or a direct reciprocity bit changes.
+edgeActions = None
+edgeActionsFlat = None
+edgeActionsByEdge = None
+edgeActionsValid = False
+
+# reverseEdgeTable[p, k] is the index (in edgeActionsByEdge) of the edge
+# from the k-th neighbor of p back to p
+reverseEdgeTable = None
+
+# The score (the sum of the payoffs against all neighbors) of every player,
+# computed from the action cache. Whenever a cached action changes, the scores
+# of both players of the edge are marked dirty and recomputed by refresh_scores.
+scores = None
+scoresFlat = None
+scoresValid = False
+scoreIsDirty = None
+dirtyScores = []
+
+
+# Allocate the action and score caches for lattices of the given shape
+# (N x N, or R x N x N for the stacked replicas of the replica engine)
+# with the neighbor tables of misc_globals
+def allocate_caches(shape):
+    global edgeActions, edgeActionsFlat, edgeActionsByEdge, edgeActionsValid
+    global reverseEdgeTable, scores, scoresFlat, scoresValid, scoreIsDirty
+    edgeActions = state_array("edgeActions", shape + (8,), np.int8)
+    edgeActionsFlat = edgeActions.reshape(-1, 8)
+    edgeActionsByEdge = edgeActions.reshape(-1)
+    reverseEdgeTable = state_array(
+        "reverseEdgeTable",
+        misc_globals.neighborTable.shape,
+        misc_globals.neighborTable.dtype,
+    )
+    np.multiply(misc_globals.neighborTable, 8, out=reverseEdgeTable)
+    reverseEdgeTable += misc_globals.reverseSlotTable
+    scores = state_array("scores", shape, float)
+    scoresFlat = scores.reshape(-1)
+    scoreIsDirty = bytearray(len(scoresFlat))
+    edgeActionsValid = False
+    scoresValid = False
+    del dirtyScores[:]
+
+
+allocate_caches((N, N))
+
+# The number of players per strategy (indexed by strategy),
+# and the number of strategies still played; updated on every takeover
+strategyCounts = [0] * games_and_strategies.numberOfStrategyIds
+numberOfAliveStrategies = 0
 
 
 def main():
-    import gui
+    if result_store.reuse_stored_results():
+        return
+
+    if config.numberOfReplicas > 1:
+        import replica_engine
+
+        replica_engine.main()
+        result_store.publish_results()
+        return
 
-    ui = gui.PlotUI()
+    if display_config.usePlots:
+        import gui
+
+        ui = gui.PlotUI()
+    else:
+        ui = HeadlessUI()
 
     # store config and initialize config.foldername
     config.store_configuration(ui.strategiesLabels)
@@ -88,6 +207,29 @@ def main():
     # run the simulation
     ui.main(simulation)
 
+    # the process of a branch ends here (see branching.py)
+    branching.exit_branch()
+
+    memmap_state.flush()
+    result_store.publish_results()
+
+
+# The UI of runs that neither show nor store anything
+class HeadlessUI:
+    def __init__(self):
+        self.strategiesLabels = [
+            games_and_strategies.strategyName[s] for s in sorted(occurringStrategies)
+        ]
+
+    def refreshUI(self, iteration):
+        pass
+
+    def signalDone(self):
+        pass
+
+    def main(self, simulationMethod):
+        simulationMethod(self)
+
 
 def simulation(ui):
     startEpochSeconds = time.time()
@@ -95,18 +237,34 @@ def simulation(ui):
 
     ui.refreshUI(0)
 
-    # Let's play
-    init_reputation()
+    # Let's play (unless the initialized state is cached, see init_cache.py)
+    if not init_cache.load_initialized_state():
+        init_reputation()
+        init_cache.store_initialized_state()
+    compute_caches()
 
     # initial refresh of UI, also stores pictures of initialization state
     ui.refreshUI(0)
 
     global iteration
     iteration = 0
+    if config.updateScheme == config.updateSchemeAsynchronous:
+        if config.engine in (config.engineSequential, config.engineKinetic):
+            use_scalar_tables()
+        if config.engine == config.engineKinetic:
+            kinetic.compute_activity()
+        elif config.engine == config.engineParallel:
+            parallel_engine.start_workers()
 
     # MAIN LOOP
+    # (synchronous updates only play whole generations of N * N iterations)
+    lastIteration = M
+    if config.updateScheme == config.updateSchemeSynchronous:
+        lastIteration = M - M % (N * N)
     steps = 0
-    for iteration in xrange(M):
+    # the iteration of the last row of statistics (not to be written twice)
+    statsIteration = None
+    while iteration < lastIteration:
         if steps >= display_config.stepsBetweenRefresh:
             status = (
                 "Iteration "
@@ -122,9 +280,17 @@ def simulation(ui):
             # reset step counter
             steps = 0
 
+            if parallel_engine.workers:
+                parallel_engine.gather_state()
+
             # compute statistics if necessary
-            if display_config.showStatsInSecondRow or config.storeStats:
+            if (
+                display_config.showStatsInSecondRow
+                or config.storeStats
+                or statistics.keepHistory
+            ):
                 statistics.updateCurrentStatistics(iteration)
+                statsIteration = iteration
 
             # refresh UI and store images
             ui.refreshUI(iteration)
@@ -133,22 +299,62 @@ def simulation(ui):
             if iteration > 1000 and we_should_terminate():
                 break
 
-        # actual work: one iteration of the simulation
-        changed = duel_with_strategy_update()
+        # fork the branches after the prefix (see branching.py)
+        if branching.pending and iteration >= config.branchIteration:
+            if branching.fork_branches():
+                break
+
+        # actual work: one iteration of the simulation,
+        # or a batch of independent iterations with the batched engine,
+        # or the skipped null iterations and an active one with the kinetic engine,
+        # or a whole generation with synchronous updates
+        if config.updateScheme == config.updateSchemeSynchronous:
+            duels, changes = synchronous.run_generation()
+        elif config.engine == config.engineSequential:
+            duels, changes = 1, int(duel_with_strategy_update())
+        else:
+            maxDuels = M - iteration
+            if branching.pending:
+                # do not play past the prefix
+                maxDuels = min(maxDuels, config.branchIteration - iteration)
+            if (
+                display_config.steps_between_refresh_mode
+                == display_config.numberOfIterations
+            ):
+                # do not skip over refreshes
+                maxDuels = min(
+                    maxDuels, max(1, display_config.stepsBetweenRefresh - steps)
+                )
+            if config.engine == config.engineBatched:
+                duels, changes = batched_engine.run_duels(maxDuels)
+            elif config.engine == config.engineKinetic:
+                duels, changes = kinetic.run_duels(maxDuels)
+            else:
+                duels, changes = parallel_engine.run_duels(maxDuels)
         if (
             display_config.steps_between_refresh_mode
             == display_config.numberOfIterations
-            or changed
         ):
-            steps += 1
-        if changed and we_should_terminate():
+            steps += duels
+        else:
+            steps += changes
+        if changes and we_should_terminate():
+            iteration += duels - 1
             break
+        iteration += duels
+    else:
+        # the last iteration played
+        iteration -= 1
 
     # FINISHED SIMULATION
+    if parallel_engine.workers:
+        parallel_engine.stop_workers()
 
     # Store stats, finalize
-    if config.storeStats:
-        statistics.updateCurrentStatistics(iteration)
+    if config.storeStats or statistics.keepHistory:
+        # (e.g., the parent of branches has written the row of the prefix)
+        if iteration != statsIteration:
+            statistics.updateCurrentStatistics(iteration)
         statistics.closeStatsFiles()
 
     # Refresh and store images one last time
@@ -161,19 +367,28 @@ def simulation(ui):
 
 def init_reputation():
     if not config.disableReputationInitializationRounds:
+        # the caches are rebuilt afterwards instead of being updated in every duel
+        invalidate_caches()
+
         # "Initialize" reputation by playing a few rounds without strategy updates
-        if config.repInitMode == config.repInitModeGlobal:
+        if config.engine != config.engineSequential or config.counterBasedRandom:
+            # many independent duels at once (with counter-based random numbers,
+            # this is the same as the scalar loop below)
+            batched_engine.init_reputation(
+                config.numberOfReputationInitializationRounds
+            )
+        elif config.repInitMode == config.repInitModeGlobal:
+            use_scalar_tables()
             for _ in xrange(config.numberOfReputationInitializationRounds):
                 # random (non-local) pairs
-                p1 = choose_one_random_player()
-                p2 = choose_one_random_player_except(p1)
+                p1, p2 = duelRandom.rep_init_players()
                 duel_without_strategy_update(p1, p2)
         elif config.repInitMode == config.repInitModeLocal:
+            use_scalar_tables()
             for _ in xrange(config.numberOfReputationInitializationRounds):
                 # rep-init with local pairs only. (Introduces good AllDs!)
-                p1 = choose_one_random_player()
-                p1Neighbors = get_neighbors(p1)
-                p2 = duelSelectionRandom.choice(p1Neighbors)
+                p1, slot = duelRandom.rep_init_player_and_slot()
+                p2 = neighborLists[p1][slot]
                 duel_without_strategy_update(p1, p2)
         else:
             print("Missing/unhandled reputation init mode!")
@@ -183,82 +398,143 @@ def init_reputation():
         print('"Initialized" reputation, starting real game')
 
 
+# Bind the list versions of the neighbor tables (building them if necessary)
+def use_scalar_tables():
+    global neighborLists, reverseSlotLists, expandedIndexLists, expandedCenterList
+    misc_globals.build_scalar_tables()
+    neighborLists = misc_globals.neighborLists
+    reverseSlotLists = misc_globals.reverseSlotLists
+    expandedIndexLists = misc_globals.expandedIndexLists
+    expandedCenterList = misc_globals.expandedCenterList
+
+
+# Build the strategy counts and the action and score caches from scratch
+def compute_caches():
+    count_strategies()
+    compute_edge_actions()
+    compute_scores()
+
+
+def invalidate_caches():
+    global edgeActionsValid, scoresValid
+    edgeActionsValid = False
+    scoresValid = False
+
+
+def count_strategies():
+    global numberOfAliveStrategies
+    strategyCounts[:] = np.bincount(
+        strategiesFlat, minlength=len(strategyCounts)
+    ).tolist()
+    numberOfAliveStrategies = sum(1 for count in strategyCounts if count > 0)
+
+
+# Check the termination conditions, remembering the reason in terminationReason
 def we_should_terminate():
-    aliveStrategies = {}
-    for i in xrange(N):
-        for j in xrange(N):
-            aliveStrategies[strategies[i, j]] = True
+    global terminationReason
+    if parallel_engine.workers:
+        parallel_engine.gather_termination_state()
+    terminationReason = termination_reason()
+    return terminationReason != ""
+
+
+# The reason for terminating the simulation now ("" if there is none)
+def termination_reason():
+    guiReputations = None
+    if config.terminateWhenRepConstant:
+        guiReputations = reputation[display_config.guiMoral][None]
+    reason = termination_reasons(
+        strategies[None],
+        guiReputations,
+        np.array([numberOfAliveStrategies]),
+        numberOfOccurringStrategies,
+    )[0]
+    if reason != "":
+        print(stoppingMessages.get(reason, reason + ", terminating ..."))
+    return reason
+
+
+# The messages for the reasons that do not just get ", terminating ..." appended
+stoppingMessages = {
+    "One strategy died": "One strategy died, stopping simulation!",
+    "All but one strategies died": "All but one strategies died, stopping simulation!",
+}
+
+
+# The reasons for terminating the simulations of R lattices ("" for the ones to
+# continue), given their strategies (R x N x N), the reputations of the GUI moral
+# (R x N x N, only needed if constant reputations terminate), their numbers of
+# alive strategies and the numbers of initially alive ones; used by all engines
+def termination_reasons(strategies, guiReputations, aliveStrategies, initiallyAlive):
+    reasons = np.full(len(strategies), "", object)
     if config.terminateWhenOneStrategyDied:
-        if len(aliveStrategies) < numberOfOccurringStrategies:
-            print("One strategy died, stopping simulation!")
-            return True
-    if config.terminateWhenOnlyOneStrategyLeft:
-        if len(aliveStrategies) <= 1:
-            print("All but one strategies died, stopping simulation!")
-            return True
-    if config.terminateWhenDiscReachesBoundary:
-        allD = games_and_strategies.allDefect
-        allC = games_and_strategies.allCooperate
-        reached = False
-        reached = reached or np.any(
-            (strategies[0, :] != allD) * (strategies[0, :] != allC)
-        )
-        reached = reached or np.any(
-            (strategies[N - 1, :] != allD) * (strategies[N - 1, :] != allC)
+        reasons[(reasons == "") & (aliveStrategies < initiallyAlive)] = (
+            "One strategy died"
         )
-        reached = reached or np.any(
-            (strategies[:, 0] != allD) * (strategies[:, 0] != allC)
+    if config.terminateWhenOnlyOneStrategyLeft:
+        reasons[(reasons == "") & (aliveStrategies <= 1)] = (
+            "All but one strategies died"
         )
-        reached = reached or np.any(
-            (strategies[:, N - 1] != allD) * (strategies[:, N - 1] != allC)
+    if (
+        config.terminateWhenDiscReachesBoundary
+        or config.terminateWhenAllCReachesBoundary
+    ):
+        boundary = np.concatenate(
+            (
+                strategies[:, 0, :],
+                strategies[:, N - 1, :],
+                strategies[:, :, 0],
+                strategies[:, :, N - 1],
+            ),
+            axis=1,
         )
-        if reached:
-            print('Discriminators reached the "boundary" of the world, terminating ...')
-            return True
-    if config.terminateWhenAllCReachesBoundary:
+        allD = games_and_strategies.allDefect
         allC = games_and_strategies.allCooperate
-        reached = False
-        reached = reached or np.any(strategies[0, :] == allC)
-        reached = reached or np.any(strategies[N - 1, :] == allC)
-        reached = reached or np.any(strategies[:, 0] == allC)
-        reached = reached or np.any(strategies[:, N - 1] == allC)
-        if reached:
-            print('allCs reached the "boundary" of the world, terminating ...')
-            return True
+    if config.terminateWhenDiscReachesBoundary:
+        reasons[
+            (reasons == "") & np.any((boundary != allD) & (boundary != allC), axis=1)
+        ] = 'Discriminators reached the "boundary" of the world'
+    if config.terminateWhenAllCReachesBoundary:
+        reasons[(reasons == "") & np.any(boundary == allC, axis=1)] = (
+            'allCs reached the "boundary" of the world'
+        )
     if config.terminateWhenRepConstant:
-        guiRep = reputation[display_config.guiMoral]
-        repConstant = np.all(guiRep[:] == guiRep[0, 0])
-        if repConstant:
-            print(
-                "Reputation for "
-                + morals.moralNames[display_config.guiMoral]
-                + " is constant, terminating ..."
-            )
-            return True
-    return False
+        guiReputations = guiReputations.reshape(len(strategies), -1)
+        reasons[
+            (reasons == "") & np.all(guiReputations == guiReputations[:, :1], axis=1)
+        ] = (
+            "Reputation for "
+            + morals.moralNames[display_config.guiMoral]
+            + " is constant"
+        )
+    return reasons
 
 
 def duel_without_strategy_update(player1, player2):
     # Determine their mixed strategy as probs to play pure strategy 0
-    strategy1 = strategies[player1]
-    strategy2 = strategies[player2]
-    moral1 = strategyMoral[strategy1]
-    moral2 = strategyMoral[strategy2]
-
-    a1 = games_and_strategies.action(
-        strategy1, get_reputation(moral1, player2, player1)
-    )
-    a2 = games_and_strategies.action(
-        strategy2, get_reputation(moral2, player1, player2)
-    )
+    strategy1 = strategiesFlat[player1]
+    strategy2 = strategiesFlat[player2]
+    moral1 = moralList[strategy1]
+    moral2 = moralList[strategy2]
+
+    # the players need not be neighbors here
+    slot1 = neighbor_index(player2, player1)
+    slot2 = neighbor_index(player1, player2)
+
+    a1 = actionList[strategy1][
+        1 if get_reputation(moral1, player2, player1, slot2) >= 0.5 else 0
+    ]
+    a2 = actionList[strategy2][
+        1 if get_reputation(moral2, player1, player2, slot1) >= 0.5 else 0
+    ]
 
     # Reputation update
     # has to be done for all morals
     repsToSet = []
     global repInitPolarizationSeed
     for moral in occurringMorals:
-        oldRep1 = get_reputation(moral, player1, player2)
-        oldRep2 = get_reputation(moral, player2, player1)
+        oldRep1 = get_reputation(moral, player1, player2, slot1)
+        oldRep2 = get_reputation(moral, player2, player1, slot2)
 
         # Use artificial polarized reputation in very first duel
         if repInitPolarizationSeed:
@@ -287,37 +563,23 @@ def duel_without_strategy_update(player1, player2):
 
 # refers to https://www.ibr.cs.tu-bs.de/trac/algogame/wiki/RepEvolST - Rot-Blau Nachbau
 # Variant (a): Replicator Updating with one neighbor
-def duel_with_strategy_update():
-    # choose focal and neighbor
-    focal = choose_one_random_player()
-    focalsNeighbors = get_neighbors(focal)
-    chosen = duelSelectionRandom.choice(focalsNeighbors)
-    chosenNeighbors = get_neighbors(chosen)
-
-    # Determine payoff
-    focalActions = dict(
-        [(nn, get_action_for_player1(focal, nn)) for nn in focalsNeighbors]
-    )
-    chosenActions = dict(
-        [(nn, get_action_for_player1(chosen, nn)) for nn in chosenNeighbors]
-    )
-    vsFocalActions = dict(
-        [(nn, get_action_for_player1(nn, focal)) for nn in focalsNeighbors]
-    )
-    vsChosenActions = dict(
-        [(nn, get_action_for_player1(nn, chosen)) for nn in chosenNeighbors]
-    )
-    focalPayoff = sum([get_payoff_for_player1(focal, nn) for nn in focalsNeighbors])
-    chosenPayoff = sum([get_payoff_for_player1(chosen, nn) for nn in chosenNeighbors])
+def duel_with_strategy_update(focal=None, chosenSlot=None):
+    # choose focal and neighbor (unless given, as by the kinetic engine)
+    if focal is None:
+        focal, chosenSlot = duelRandom.focal_and_slot()
+    chosen = neighborLists[focal][chosenSlot]
+
+    # Determine actions and payoff
+    read_actions(focal, focalActions, vsFocalActions)
+    read_actions(chosen, chosenActions, vsChosenActions)
+    refresh_scores()
+    focalPayoff = scoresFlat.item(focal)
+    chosenPayoff = scoresFlat.item(chosen)
 
     # Store actions in lastAction
     if display_config.showLastActionMatrix:
-        for neighbor in focalsNeighbors:
-            store_last_action(focal, neighbor, focalActions[neighbor])
-            store_last_action(neighbor, focal, vsFocalActions[neighbor])
-        for neighbor in chosenNeighbors:
-            store_last_action(chosen, neighbor, chosenActions[neighbor])
-            store_last_action(neighbor, chosen, vsChosenActions[neighbor])
+        store_last_actions(focal, focalActions, vsFocalActions)
+        store_last_actions(chosen, chosenActions, vsChosenActions)
 
     # (Potential) strategy update
     changed = semideterministic_replicator_update(
@@ -325,108 +587,132 @@ def duel_with_strategy_update():
     )
 
     # do updates in random order
-    duelSelectionRandom.shuffle(focalsNeighbors)
-    duelSelectionRandom.shuffle(chosenNeighbors)
+    focalsOrder[:] = neighborSlots
+    chosenOrder[:] = neighborSlots
+    duelRandom.shuffle_orders(focalsOrder, chosenOrder)
 
-    # with a certain probability insert heaven/hell players into focalsNeighbors and chosenNeighbors
+    # with a certain probability, focal and chosen additionally meet heaven/hell
+    focalcontact_heaven = focalcontact_hell = 0
+    chosencontact_heaven = chosencontact_hell = 0
     if config.supernaturalMode:
         if config.heavenHellTogether:
-            focalcontact_heaven = bernoulli(
-                config.heavenContactProbFocal, duelSelectionRandom
-            )
+            focalcontact_heaven = (
+                duelRandom.contact(0) <= config.heavenContactProbFocal
+            ) * 1
             focalcontact_hell = focalcontact_heaven
-            chosencontact_heaven = bernoulli(
-                config.heavenContactProbChosen, duelSelectionRandom
-            )
+            chosencontact_heaven = (
+                duelRandom.contact(1) <= config.heavenContactProbChosen
+            ) * 1
             chosencontact_hell = chosencontact_heaven
         else:
-            focalcontact_heaven = bernoulli(
-                config.heavenContactProbFocal, duelSelectionRandom
-            )
-            focalcontact_hell = bernoulli(
-                config.hellContactProbFocal, duelSelectionRandom
-            )
-            chosencontact_heaven = bernoulli(
-                config.heavenContactProbChosen, duelSelectionRandom
-            )
-            chosencontact_hell = bernoulli(
-                config.hellContactProbChosen, duelSelectionRandom
-            )
-
-        if focalcontact_heaven == 1:
-            focalsNeighbors.append(HEAVEN)
-            focalActions[HEAVEN] = games_and_strategies.action(strategies[focal], 1)
-        if focalcontact_hell == 1:
-            focalsNeighbors.append(HELL)
-            focalActions[HELL] = games_and_strategies.action(strategies[focal], 0)
-
-        if chosencontact_heaven == 1:
-            chosenNeighbors.append(HEAVEN)
-            chosenActions[HEAVEN] = games_and_strategies.action(strategies[chosen], 1)
-        if chosencontact_hell == 1:
-            chosenNeighbors.append(HELL)
-            chosenActions[HELL] = games_and_strategies.action(strategies[chosen], 0)
-
-    repsToSet = []
-    safedirepUpdatesToSet = []
+            focalcontact_heaven = (
+                duelRandom.contact(0) <= config.heavenContactProbFocal
+            ) * 1
+            focalcontact_hell = (
+                duelRandom.contact(1) <= config.hellContactProbFocal
+            ) * 1
+            chosencontact_heaven = (
+                duelRandom.contact(2) <= config.heavenContactProbChosen
+            ) * 1
+            chosencontact_hell = (
+                duelRandom.contact(3) <= config.hellContactProbChosen
+            ) * 1
+
+    # actions against heaven and hell (played with the possibly updated strategy)
+    focalStrategyActions = actionList[strategiesFlat[focal]]
+    focalActions[heavenSlot] = focalStrategyActions[1]
+    focalActions[hellSlot] = focalStrategyActions[0]
+    chosenStrategyActions = actionList[strategiesFlat[chosen]]
+    chosenActions[heavenSlot] = chosenStrategyActions[1]
+    chosenActions[hellSlot] = chosenStrategyActions[0]
 
     # TODO: update mode - make it possible to update all neighbors' reputation
-    # reputation update: again 'simulate' the played duels
-    global repInitPolarizationSeed
+    # reputation update: again 'simulate' the played duels.
+    # The updates of one moral only read and write the state of that moral,
+    # so we can perform them as soon as both focal and chosen are done.
+    focalSlotOfChosen = reverseSlotLists[focal][chosenSlot]
     for moral in occurringMorals:
-        focalRep = get_reputation(moral, focal, chosen)
-        chosenRep = get_reputation(moral, chosen, focal)
-
-        # update reputation for focal
-        for neighbor in focalsNeighbors:
-            focalsAction = focalActions[neighbor]
-            focalRep = morals.newReputation[moral](
-                focal,
-                moral,
-                focalRep,
-                get_reputation(moral, neighbor, focal),
-                focalsAction,
-            )
-            if moral in safedirep.againstPlayerBits:
-                if neighbor not in [HEAVEN, HELL, polarizingPlayer]:
-                    neighborsAction = vsFocalActions[neighbor]
-                    safedirepUpdatesToSet.append((moral, neighbor, focal, focalsAction))
-                    safedirepUpdatesToSet.append(
-                        (moral, focal, neighbor, neighborsAction)
-                    )
-
-        # update reputation for chosen
-        for neighbor in chosenNeighbors:
-            chosenAction = chosenActions[neighbor]
-            chosenRep = morals.newReputation[moral](
-                chosen,
-                moral,
-                chosenRep,
-                get_reputation(moral, neighbor, chosen),
-                chosenAction,
-            )
-            if moral in safedirep.againstPlayerBits:
-                if neighbor not in [HEAVEN, HELL, polarizingPlayer]:
-                    neighborsAction = vsChosenActions[neighbor]
-                    safedirepUpdatesToSet.append(
-                        (moral, neighbor, chosen, chosenAction)
-                    )
-                    safedirepUpdatesToSet.append(
-                        (moral, chosen, neighbor, neighborsAction)
-                    )
-
-        repsToSet.append((moral, focal, focalRep))
-        repsToSet.append((moral, chosen, chosenRep))
-
-    # actually perform the updates
-    for moral, focal, newRep in repsToSet:
-        set_reputation(moral, focal, newRep)
-    for moral, victim, actor, action in safedirepUpdatesToSet:
-        safedirep.store_action(moral, victim, actor, action)
+        focalRep = replay_duels(
+            moral,
+            focal,
+            get_reputation(moral, focal, chosen, focalSlotOfChosen),
+            focalActions,
+            focalsOrder,
+            focalcontact_heaven,
+            focalcontact_hell,
+        )
+        chosenRep = replay_duels(
+            moral,
+            chosen,
+            get_reputation(moral, chosen, focal, chosenSlot),
+            chosenActions,
+            chosenOrder,
+            chosencontact_heaven,
+            chosencontact_hell,
+        )
+
+        # actually perform the updates
+        set_reputation(moral, focal, focalRep)
+        set_reputation(moral, chosen, chosenRep)
+        if moral in safedirep.againstPlayerBits:
+            store_played_actions(moral, focal, focalActions, vsFocalActions)
+            store_played_actions(moral, chosen, chosenActions, vsChosenActions)
 
     return changed
 
 
+# Read the actions of player against its neighbors and of its neighbors against player
+# from the action cache into the given buffers (indexed by slot)
+def read_actions(player, actions, vsActions):
+    actions[:8] = edgeActionsFlat[player].tolist()
+    vsActions[:8] = edgeActionsByEdge[reverseEdgeTable[player]].tolist()
+
+
+# Replay the duels of player against its neighbors (in the given order)
+# and against heaven and hell to update the reputation rep of player in moral
+def replay_duels(moral, player, rep, actions, order, meetsHeaven, meetsHell):
+    newReputation = morals.newReputation[moral]
+    neighbors = neighborLists[player]
+    for k in order:
+        rep = newReputation(
+            player,
+            moral,
+            rep,
+            get_reputation(moral, neighbors[k], player, k),
+            actions[k],
+        )
+    if meetsHeaven:
+        rep = newReputation(player, moral, rep, 1, actions[heavenSlot])
+    if meetsHell:
+        rep = newReputation(player, moral, rep, 0, actions[hellSlot])
+    return rep
+
+
+# Remember the actions played between player and its neighbors for direct reciprocity
+def store_played_actions(moral, player, actions, vsActions):
+    neighbors = neighborLists[player]
+    reverseSlots = reverseSlotLists[player]
+    bits = safedirep.againstPlayerBitsFlat[moral]
+    playerUsesBits = moralList[strategiesFlat[player]] == moral
+    for k in neighborSlots:
+        neighbor = neighbors[k]
+        if neighbor != polarizingPlayer:
+            reverseSlot = reverseSlots[k]
+            # the bits only affect the actions of players judging by this moral
+            inChanged = (
+                moralList[strategiesFlat[neighbor]] == moral
+                and bits[neighbor, reverseSlot] != actions[k]
+            )
+            outChanged = playerUsesBits and bits[player, k] != vsActions[k]
+            safedirep.store_action(moral, neighbor, reverseSlot, actions[k])
+            safedirep.store_action(moral, player, k, vsActions[k])
+            if edgeActionsValid:
+                if inChanged:
+                    update_edge_action(neighbor, reverseSlot)
+                if outChanged:
+                    update_edge_action(player, k)
+
+
 def semideterministic_replicator_update(focal, chosen, focalPayoff, chosenPayoff):
     diff = chosenPayoff - focalPayoff
     if config.deterministicStrategyUpdates:
@@ -435,18 +721,40 @@ def semideterministic_replicator_update(focal, chosen, focalPayoff, chosenPayoff
         probForChosen = (0 if diff <= 0 else diff) / replicatorUpdateMaxScore
     if probForChosen <= 0:
         return False
-    chosenMayReplace = bernoulli(probForChosen, duelSelectionRandom)
-    if chosenMayReplace == 0:
+    if duelRandom.replicator() > probForChosen:
         return False
     # Takeover!
-    changed = strategies[chosen] != strategies[focal]
-    strategies[focal] = strategies[chosen]
-    return changed
+    oldStrategy = strategiesFlat[focal]
+    newStrategy = strategiesFlat[chosen]
+    if oldStrategy == newStrategy:
+        return False
+    strategiesFlat[focal] = newStrategy
+    if edgeActionsValid:
+        update_edges_of(focal)
+    record_takeover(oldStrategy, newStrategy)
+    return True
+
+
+# Keep track of the surviving strategies when a player switches strategies
+def record_takeover(oldStrategy, newStrategy):
+    global numberOfAliveStrategies
 
+    strategyCounts[oldStrategy] -= 1
+    if strategyCounts[oldStrategy] == 0:
+        numberOfAliveStrategies -= 1
+    strategyCounts[newStrategy] += 1
+    if strategyCounts[newStrategy] == 1:
+        numberOfAliveStrategies += 1
 
+
+# The offset of neighbor relative to player (for flat player indices).
+# Also defined for players that are not neighbors (as needed in global reputation
+# initialization), where each coordinate of the difference is clamped to {-1, 0, 1}.
 def neighbor_offset(player, neighbor):
-    diffx = neighbor[0] - player[0]
-    diffy = neighbor[1] - player[1]
+    px, py = player_coordinates(player)
+    nx, ny = player_coordinates(neighbor)
+    diffx = nx - px
+    diffy = ny - py
     if diffx > 1:  # player must be in top row
         diffx = -1
     elif diffx < -1:  # player must be in bottom row
@@ -458,37 +766,39 @@ def neighbor_offset(player, neighbor):
     return (diffx, diffy)
 
 
+# The slot of neighbor in the neighbor list of player;
+# for actual neighbors, this is the same as neighborLists[player].index(neighbor)
 def neighbor_index(player, neighbor):
     return neighbor_offsets_index[neighbor_offset(player, neighbor)]
 
 
-def store_last_action(actor, neighbor, action):
+# Store the action of actor against its slot-th neighbor
+def store_last_action(actor, slot, action):
     if display_config.showLastActionMatrix:
-        offset = neighbor_offset(actor, neighbor)
-        x = 3 * actor[0] + 1 + offset[0]
-        y = 3 * actor[1] + 1 + offset[1]
-        lastAction[x, y] = action
+        lastActionFlat[expandedIndexLists[actor][slot]] = action
 
 
-def get_neighbors(focal):
-    return [((focal[0] + x) % N, (focal[1] + y) % N) for (x, y) in neighbor_offsets]
+# Store the actions of player against its neighbors and vice versa
+def store_last_actions(player, actions, vsActions):
+    neighbors = neighborLists[player]
+    reverseSlots = reverseSlotLists[player]
+    for k in neighborSlots:
+        store_last_action(player, k, actions[k])
+        store_last_action(neighbors[k], reverseSlots[k], vsActions[k])
 
 
-def get_action_for_player1(player1, player2):
-    strategy = strategies[player1]
-    moral = games_and_strategies.strategyMoral[strategy]
-    return games_and_strategies.action(
-        strategy, get_reputation(moral, player2, player1)
+# The action of player1 against player2, the slot-th neighbor of player1
+def get_action_for_player1(player1, player2, slot):
+    strategy = strategiesFlat[player1]
+    repBit = (
+        1 if get_reputation(moralList[strategy], player2, player1, slot) >= 0.5 else 0
     )
+    return actionList[strategy][repBit]
 
 
-def get_payoff_for_player1(player1, player2):
-    a1 = get_action_for_player1(player1, player2)
-    a2 = get_action_for_player1(player2, player1)
-    return payoffs[a1, a2]
-
-
-def get_reputation(moral, judged, judging):
+# The reputation of judged in the eyes of judging;
+# judged is the slot-th neighbor of judging
+def get_reputation(moral, judged, judging, slot):
     global polarizingPlayer
 
     # heaven & hell are globally seen as good/evil
@@ -501,67 +811,141 @@ def get_reputation(moral, judged, judging):
     if judged == polarizingPlayer:
         return 0 if moral in morals.polarizationSeedScepticMorals else 1
 
+    rep = reputationFlat[moral]
     if moral == morals.smartMafia:
-        return smart_mafia.get_reputation(
-            reputation[moral][judging], reputation[moral][judged]
-        )
+        return smart_mafia.get_reputation(rep[judging], rep[judged])
 
     # handle morals with direct reciprocity
     if moral in safedirep.againstPlayerBits:
         # direct reciprocity only changes things if the target is globally bad
-        if reputation[moral][judged] < 0.5:
-            lastAction = safedirep.againstPlayerBits[moral][
-                judging[0], judging[1], neighbor_index(judging, judged)
-            ]
+        if rep[judged] < 0.5:
+            lastAction = safedirep.againstPlayerBitsFlat[moral][judging, slot]
 
             # have we seen her before?
             if lastAction != -1:
                 return 1 if lastAction == games_and_strategies.cooperate else 0
 
     # otherwise, use normal reputation
-    return reputation[moral][judged]
+    return rep[judged]
 
 
 def set_reputation(moral, player, newReputation):
-    reputation[moral][player] = newReputation
+    rep = reputationFlat[moral]
+    if edgeActionsValid and rep[player] != newReputation:
+        rep[player] = newReputation
+        update_edges_to(player, moral)
+        if moral == morals.smartMafia:
+            # smart mafia players also take their own reputation into account
+            update_edges_of(player, moral)
+    else:
+        rep[player] = newReputation
 
     # update safedirep visualization
     if moral in safedirep.againstPlayerBits:
         # Store global view on player in matrix
-        x = 3 * player[0] + 1
-        y = 3 * player[1] + 1
-        safedirep.visualMatrix[moral][x, y] = newReputation
+        safedirep.visualMatrixFlat[moral][expandedCenterList[player]] = newReputation
 
 
-def choose_one_random_player():
-    return (
-        duelSelectionRandom.randint(0, N - 1),
-        duelSelectionRandom.randint(0, N - 1),
-    )
+# Fill the action cache from scratch
+def compute_edge_actions():
+    global edgeActionsValid
+    players = np.arange(len(edgeActionsFlat))
+    for k in neighborSlots:
+        edgeActionsFlat[:, k] = vectorized.get_actions(
+            players, np.full(len(players), k)
+        )
+    edgeActionsValid = True
 
 
-def choose_one_random_player_except(exceptions):
-    if not isinstance(exceptions, list):
-        exceptions = [exceptions]
-    player = choose_one_random_player()
-    while player in exceptions:
-        player = choose_one_random_player()
-    return player
+# Store a new action of player against its slot-th neighbor in the action cache;
+# if it differs from the cached one, the scores of both players become invalid
+def set_edge_action(player, slot, action):
+    if edgeActionsFlat[player, slot] != action:
+        edgeActionsFlat[player, slot] = action
+        invalidate_score(player)
+        invalidate_score(neighborLists[player][slot])
 
 
-def score_without_updates(player):
-    neighbors = get_neighbors(player)
-    return sum([get_payoff_for_player1(player, nn) for nn in neighbors])
+# Recompute the cached action of player against its slot-th neighbor
+def update_edge_action(player, slot):
+    set_edge_action(
+        player,
+        slot,
+        get_action_for_player1(player, neighborLists[player][slot], slot),
+    )
 
 
-def compute_welfare():
-    welfare = np.zeros((N, N), float)
+# Recompute the cached actions of player against its neighbors
+# (only if player judges by the given moral, if any)
+def update_edges_of(player, moral=None):
+    if moral is not None and moralList[strategiesFlat[player]] != moral:
+        return
+    neighbors = neighborLists[player]
+    for k in neighborSlots:
+        set_edge_action(player, k, get_action_for_player1(player, neighbors[k], k))
+
+
+# Recompute the cached actions of the neighbors judging by moral against player
+def update_edges_to(player, moral):
+    neighbors = neighborLists[player]
+    reverseSlots = reverseSlotLists[player]
+    for k in neighborSlots:
+        neighbor = neighbors[k]
+        if moralList[strategiesFlat[neighbor]] == moral:
+            set_edge_action(
+                neighbor,
+                reverseSlots[k],
+                get_action_for_player1(neighbor, player, reverseSlots[k]),
+            )
 
-    for x in xrange(N):
-        for y in xrange(N):
-            welfare[x, y] = score_without_updates((x, y)) / replicatorUpdateMaxScore
 
-    return welfare
+# The scores of the given players, computed from the action cache
+def cached_scores(players):
+    payoffsPerEdge = games_and_strategies.payoffTable[
+        edgeActionsFlat[players], edgeActionsByEdge[reverseEdgeTable[players]]
+    ]
+    # sum up in the same order as refresh_scores,
+    # such that the results are exactly the same
+    result = payoffsPerEdge[:, 0].copy()
+    for k in neighborSlots[1:]:
+        result += payoffsPerEdge[:, k]
+    return result
+
+
+# Compute the scores of all players from the action cache
+def compute_scores():
+    global scoresValid
+    scoresFlat[:] = cached_scores(np.arange(len(scoresFlat)))
+    for player in dirtyScores:
+        scoreIsDirty[player] = 0
+    del dirtyScores[:]
+    scoresValid = True
+
+
+def invalidate_score(player):
+    if not scoreIsDirty[player]:
+        scoreIsDirty[player] = 1
+        dirtyScores.append(player)
+
+
+# Recompute the scores that became invalid since the last call
+def refresh_scores():
+    for player in dirtyScores:
+        actions = edgeActionsFlat[player].tolist()
+        vsActions = edgeActionsByEdge[reverseEdgeTable[player]].tolist()
+        score = 0
+        for k in neighborSlots:
+            score += payoffList[actions[k]][vsActions[k]]
+        scoresFlat[player] = score
+        scoreIsDirty[player] = 0
+    del dirtyScores[:]
+
+
+def compute_welfare():
+    if not scoresValid:
+        compute_caches()
+    refresh_scores()
+    return scores / replicatorUpdateMaxScore
 
 
 def update_current_welfare():
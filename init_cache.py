@@ -0,0 +1,172 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import misc_globals
+from cmdline_args import args, result_parameter_lines
+from misc_globals import seed, strategies
+from result_store import source_version
+
+# The cache of initialized states (--init-cache): the state after the
+# initialization of the strategies (the scenario) and of the reputations (the
+# reputation initialization rounds) is stored in the cache folder as
+# <key>.npz, where key hashes the parameters affecting it, the seed and the
+# source code of the simulator. A run finding its key there loads the state
+# instead of repeating the initialization and then continues exactly as if it
+# had repeated it (except with --rng numpy, whose buffered random numbers are
+# not part of the stored generator states, see rng.BufferedRandom).
+
+# The options that do not affect the initialized state
+# (they only concern the main loop or the output)
+mainLoopOptions = [
+    "U",
+    "M",
+    "terminate_if_disc_reaches_boundary",
+    "terminate_if_allC_reaches_boundary",
+    "workers",
+    "update_scheme",
+    "branches",
+    "branch_after",
+    "deterministic_strategy_updates",
+    "heaven_prob",
+    "heaven_prob_focal",
+    "heaven_prob_chosen",
+    "hell_prob",
+    "hell_prob_focal",
+    "hell_prob_chosen",
+    "heaven_hell_together",
+    "steps_between_refresh",
+    "refresh_mode",
+    "no_stats",
+    "welfare",
+    "output_folder",
+    "store",
+    "store_hit",
+    "init_cache",
+    "memmap_state",
+    "strategy_colors",
+    "no_morals_diff",
+    "gui_backend",
+    "store_whole_pictures",
+    "no_images",
+    "first_row",
+    "no_gui_stats",
+    "no_gui",
+    "gui_moral",
+]
+
+cacheFolder = args.init_cache
+
+
+# The name of the cache file of this run
+def cache_key():
+    values = dict(args.__dict__)
+    for option in mainLoopOptions:
+        values[option] = None
+    lines = result_parameter_lines(argparse.Namespace(**values))
+    lines.append("random seed = " + str(seed))
+    lines.append("source version = " + source_version())
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+cacheFile = None
+cachedState = None
+if cacheFolder is not None:
+    cacheFile = os.path.join(cacheFolder, cache_key() + ".npz")
+    if os.path.exists(cacheFile):
+        with np.load(cacheFile) as npzFile:
+            cachedState = dict(npzFile)
+
+
+# The stored generator states are JSON, which turns tuples into lists
+def to_tuples(state):
+    if isinstance(state, list):
+        return tuple(to_tuples(value) for value in state)
+    return state
+
+
+# The per-moral state arrays, by their names in the cache file
+def moral_arrays():
+    from state_snapshot import moralStates
+
+    arrays = {}
+    for name, moralArrays in moralStates.items():
+        for moral, array in moralArrays.items():
+            arrays["%s-%d" % (name, moral)] = array
+    return arrays
+
+
+# Install the cached initial strategies; returns whether they are cached
+def load_strategies():
+    if cachedState is None:
+        return False
+    np.copyto(strategies, cachedState["strategies"])
+    return True
+
+
+# Install the cached initialized state (instead of implementation.init_reputation);
+# returns whether it is cached
+def load_initialized_state():
+    import implementation
+    from state_snapshot import random_generators
+
+    if cachedState is None:
+        return False
+    for key, array in moral_arrays().items():
+        np.copyto(array, cachedState[key])
+    randomStates = json.loads(str(cachedState["randomStates"]))
+    for rand, state in zip(random_generators(), randomStates["generators"]):
+        rand.setstate(to_tuples(state))
+    misc_globals.batchedDuelRandom.bit_generator.state = randomStates["batched"]
+    np.random.set_state(randomStates["numpy"])
+    implementation.repInitPolarizationSeed = bool(
+        cachedState["repInitPolarizationSeed"]
+    )
+    print("Loaded the initialized state from " + cacheFile + ".")
+    return True
+
+
+# Store the initialized state (after implementation.init_reputation)
+def store_initialized_state():
+    import implementation
+    from state_snapshot import random_generators
+
+    if cacheFolder is None:
+        return
+    arrays = dict(moral_arrays(), strategies=strategies)
+    randomStates = {
+        "generators": [rand.getstate() for rand in random_generators()],
+        "batched": misc_globals.batchedDuelRandom.bit_generator.state,
+        "numpy": np.random.get_state(legacy=False),
+    }
+    arrays["randomStates"] = np.array(
+        json.dumps(randomStates, default=np.ndarray.tolist)
+    )
+    arrays["repInitPolarizationSeed"] = np.array(implementation.repInitPolarizationSeed)
+    os.makedirs(cacheFolder, exist_ok=True)
+    # written to a temporary file first, so that concurrent runs never read
+    # partially written files
+    temporaryFile = cacheFile + ".tmp-" + str(os.getpid())
+    with open(temporaryFile, "wb") as npzFile:
+        np.savez(npzFile, **arrays)
+    os.replace(temporaryFile, cacheFile)
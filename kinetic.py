@@ -0,0 +1,220 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+from math import log
+
+from games_and_strategies import actionTable
+from misc_globals import (
+    N,
+    strategiesFlat,
+    reputationFlat,
+    neighborTable,
+    neighborTableChunk,
+    occurringMorals,
+    duelSelectionRandom,
+)
+from memmap_state import state_array
+
+import config
+import morals
+import safedirep
+import vectorized
+import implementation
+
+# Kinetic (event-driven) engine: most duels of a late-stage run happen inside
+# homogeneous domains and cannot change anything. A duel of focal and its
+# k-th neighbor is null if no takeover is possible and, for both players,
+# every single reputation update of their replay (against each neighbor and
+# against heaven and hell) leaves their reputation and the state of the moral
+# unchanged, and the direct reciprocity bits stored on their edges are up to
+# date. Then any replay in any order changes nothing, whatever the random
+# numbers of the duel are.
+# We keep track of the pairs (focal, k) that are not null ("active") and only
+# play those. Since every iteration plays each of the 8 * N * N pairs with the
+# same probability, the number of null duels before the next active one is
+# geometrically distributed; the iteration counter advances by this number,
+# which keeps the time scale of the sequential engine.
+
+numberOfPairs = 8 * N * N
+
+# pairIsActive[p, k] is True if the duel of p and its k-th neighbor is active;
+# the first numberOfActivePairs entries of activePairs are the active pairs
+# (as p * 8 + k) in arbitrary order, and positionOfPair[p * 8 + k] is the
+# position of the pair in activePairs (or -1)
+pairIsActive = state_array("pairIsActive", (N * N, 8), bool)
+activePairs = state_array("activePairs", (numberOfPairs,), np.int32)
+numberOfActivePairs = 0
+positionOfPair = state_array("positionOfPair", (numberOfPairs,), np.int32, -1)
+
+# playerIsUnstable[p] is True if a duel may change the state of p
+playerIsUnstable = state_array("playerIsUnstable", (N * N,), bool, True)
+
+# Offsets of the players within distance 3 (whose stability may change in a
+# duel) and distance 4 (whose pairs may become active or null) of focal
+stabilityX, stabilityY = [offsets.ravel() for offsets in np.mgrid[-3:4, -3:4]]
+activityX, activityY = [offsets.ravel() for offsets in np.mgrid[-4:5, -4:5]]
+
+
+# Advance by at most maxDuels iterations: skip the null duels up to the next
+# active one and play it; returns the number of iterations and the number of
+# duels that changed a strategy
+def run_duels(maxDuels):
+    if not numberOfActivePairs:
+        return maxDuels, 0
+    activeFraction = numberOfActivePairs / numberOfPairs
+    skip = 0
+    if activeFraction < 1:
+        skip = int(
+            log(1.0 - duelSelectionRandom.random()) / log(1.0 - activeFraction)
+        )
+    if skip >= maxDuels:
+        # the number of null duels is memoryless, so we can draw it anew next time
+        return maxDuels, 0
+
+    focal, chosenSlot = divmod(
+        int(activePairs[duelSelectionRandom.randrange(numberOfActivePairs)]), 8
+    )
+    changed = implementation.duel_with_strategy_update(focal, chosenSlot)
+    update_activity(focal)
+    return skip + 1, int(changed)
+
+
+# Determine the active pairs from scratch
+# (in chunks of players, so that the temporary arrays stay small)
+def compute_activity():
+    global numberOfActivePairs
+    implementation.refresh_scores()
+    for start in range(0, N * N, neighborTableChunk):
+        players = np.arange(start, min(start + neighborTableChunk, N * N))
+        playerIsUnstable[players] = unstable_players(players)
+    positionOfPair[:] = -1
+    numberOfActivePairs = 0
+    for start in range(0, N * N, neighborTableChunk):
+        players = np.arange(start, min(start + neighborTableChunk, N * N))
+        active = active_pairs(players)
+        pairIsActive[players] = active
+        pairs = start * 8 + np.flatnonzero(active)
+        positions = np.arange(numberOfActivePairs, numberOfActivePairs + len(pairs))
+        activePairs[positions] = pairs
+        positionOfPair[pairs] = positions
+        numberOfActivePairs += len(pairs)
+
+
+# Update the active pairs after a duel of focal
+def update_activity(focal):
+    global numberOfActivePairs
+    implementation.refresh_scores()
+    players = players_around(focal, stabilityX, stabilityY)
+    playerIsUnstable[players] = unstable_players(players)
+
+    players = players_around(focal, activityX, activityY)
+    active = active_pairs(players)
+    changed = active != pairIsActive[players]
+    pairIsActive[players] = active
+    for pair, nowActive in zip(
+        (players[:, None] * 8 + np.arange(8))[changed].tolist(),
+        active[changed].tolist(),
+    ):
+        if nowActive:
+            positionOfPair[pair] = numberOfActivePairs
+            activePairs[numberOfActivePairs] = pair
+            numberOfActivePairs += 1
+        else:
+            # move the last pair into the gap
+            position = positionOfPair[pair]
+            numberOfActivePairs -= 1
+            last = int(activePairs[numberOfActivePairs])
+            if last != pair:
+                activePairs[position] = last
+                positionOfPair[last] = position
+            positionOfPair[pair] = -1
+
+
+# The (distinct) players at the given offsets of focal
+def players_around(focal, offsetsX, offsetsY):
+    x, y = divmod(focal, N)
+    return np.unique(((x + offsetsX) % N) * N + (y + offsetsY) % N)
+
+
+# Whether a duel may change the state of the players (see above)
+def unstable_players(players):
+    strategy = strategiesFlat[players]
+    neighbors = neighborTable[players]
+    judging = np.broadcast_to(players[:, None], neighbors.shape)
+    slots = np.broadcast_to(np.arange(8), neighbors.shape)
+    actions = implementation.edgeActionsFlat[players]
+    reverseEdges = implementation.reverseEdgeTable[players]
+    vsActions = implementation.edgeActionsByEdge[reverseEdges]
+
+    # the updates of the replay: against all neighbors and (if possible)
+    # against heaven (who is good) and hell (who is bad);
+    # one column per update
+    updateActions = [actions]
+    supernaturalReputations = []
+    meetsHeaven = max(config.heavenContactProbFocal, config.heavenContactProbChosen) > 0
+    meetsHell = max(config.hellContactProbFocal, config.hellContactProbChosen) > 0
+    if config.heavenHellTogether:
+        meetsHell = meetsHeaven
+    if meetsHeaven:
+        updateActions.append(actionTable[strategy, 1][:, None])
+        supernaturalReputations.append(np.ones((len(players), 1), int))
+    if meetsHell:
+        updateActions.append(actionTable[strategy, 0][:, None])
+        supernaturalReputations.append(np.zeros((len(players), 1), int))
+    updateActions = np.hstack(updateActions)
+    updating = np.repeat(players, updateActions.shape[1])
+
+    unstable = np.zeros(len(players), bool)
+    for moral in occurringMorals:
+        neighborReputations = vectorized.get_reputations(
+            moral, neighbors.ravel(), judging.ravel(), slots.ravel()
+        ).reshape(neighbors.shape)
+        fixed = morals.reputationIsFixedPoint[moral](
+            updating,
+            moral,
+            reputationFlat[moral][updating],
+            np.hstack([neighborReputations] + supernaturalReputations).ravel(),
+            updateActions.ravel(),
+        )
+        unstable |= ~fixed.reshape(updateActions.shape).all(axis=1)
+
+        if moral in safedirep.againstPlayerBits:
+            # the bits stored by the players and by their neighbors about them
+            # (the bits of edges to the polarizing player are never written)
+            bits = safedirep.againstPlayerBitsFlat[moral]
+            storedVsActions = bits[players]
+            storedActions = bits.reshape(-1)[reverseEdges]
+            upToDate = (
+                (storedVsActions == vsActions) & (storedActions == actions)
+            ) | (neighbors == vectorized.polarizingPlayer)
+            unstable |= ~upToDate.all(axis=1)
+    return unstable
+
+
+# Whether the duels of the players with their neighbors are active
+def active_pairs(players):
+    neighbors = neighborTable[players]
+    scores = implementation.scoresFlat
+    takeoverPossible = (
+        strategiesFlat[neighbors] != strategiesFlat[players][:, None]
+    ) & (scores[neighbors] > scores[players][:, None])
+    return (
+        takeoverPossible
+        | playerIsUnstable[players][:, None]
+        | playerIsUnstable[neighbors]
+    )
@@ -15,8 +15,13 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import implementation
+import sys
+
+import cmdline_args
 
 
 if __name__ == "__main__":
+    cmdline_args.set_args(sys.argv[1:], cmdline_args.parse(sys.argv[1:]))
+    import implementation
+
     implementation.main()
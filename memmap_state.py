@@ -0,0 +1,88 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import atexit
+import os
+import shutil
+
+import numpy as np
+
+from cmdline_args import args
+
+# Memory-mapped state (--memmap-state): the state arrays (the strategies, the
+# reputations, the bits and histories of the morals, the action and score
+# caches and the last actions) and the other arrays that grow with the lattice
+# (the neighbor tables and the work arrays of the engines) are backed by .npy
+# files instead of memory, so that lattices larger than the memory can be
+# simulated, and other processes
+# can inspect a running simulation with np.load(file, mmap_mode="r"). The
+# arrays are allocated before the output folder exists, so their files are
+# created in a temporary folder next to it and moved to the subfolder "state"
+# of the output folder once it exists (see move_to); the mappings stay valid.
+# The temporary folder is removed at exit if the run ends before that.
+
+mapState = args.memmap_state
+
+if args.store is not None:
+    parentFolder = args.store
+elif args.output_folder is not None:
+    parentFolder = os.path.dirname(os.path.abspath(args.output_folder))
+else:
+    parentFolder = os.curdir
+temporaryFolder = os.path.join(parentFolder, ".state-" + str(os.getpid()))
+stateFolder = temporaryFolder
+
+# The memory-mapped arrays, by name
+mappedArrays = {}
+
+
+def remove_temporary_folder():
+    if os.path.isdir(temporaryFolder):
+        shutil.rmtree(temporaryFolder)
+
+
+# A new state array of the given shape and dtype, filled with fill; with
+# --memmap-state, it is mapped to the file <name>.npy of the state folder
+def state_array(name, shape, dtype, fill=0):
+    if not mapState:
+        return np.full(shape, fill, dtype)
+    if not mappedArrays:
+        os.makedirs(stateFolder)
+        atexit.register(remove_temporary_folder)
+    array = np.lib.format.open_memmap(
+        os.path.join(stateFolder, name + ".npy"), "w+", dtype, shape
+    )
+    array[...] = fill
+    mappedArrays[name] = array
+    return array
+
+
+# Move the state files to the subfolder "state" of the output folder
+def move_to(foldername):
+    global stateFolder
+    if not mapState:
+        return
+    stateFolder = os.path.join(foldername, "state")
+    os.rename(temporaryFolder, stateFolder)
+
+
+# Write the state to its files (the mappings are shared, so other processes
+# see the current state without this, but only up to the last flush survives
+# a crash of the machine)
+def flush():
+    for array in mappedArrays.values():
+        array.flush()
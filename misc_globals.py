@@ -17,7 +17,9 @@
 
 import numpy as np
 import random
+import rng
 from cmdline_args import args
+from memmap_state import mapState, state_array
 from math import ceil, log10
 
 # Populations size (side length)
@@ -28,8 +30,20 @@ M = args.M  # use command line argument
 # The number of digits in M in decimal notation
 numberOfDigitsInM = str(int(ceil(log10(M))))
 
+# Compact dtypes of the state arrays: the strategy ids, the binary reputations and
+# the actions and histories stored by the morals are small integers, and the
+# fractional reputations of smart mafia (0, 0.5, 0.75 and 1) are exact in single
+# precision. This shrinks the state arrays about eightfold; most of the memory of a
+# large lattice is taken by the index tables below, the caches of implementation
+# and the work arrays of the engines.
+stateInt = np.int8
+stateFloat = np.float32
+# Dtype of the index tables (see build_neighbor_tables): their largest entries
+# are the indices of the 3N x 3N expanded matrices
+indexInt = np.int32 if 9 * N * N <= np.iinfo(np.int32).max else np.int64
+
 # Define matrices here
-strategies = np.zeros((N, N), int)
+strategies = state_array("strategies", (N, N), stateInt)
 reputation = {}  # initialized in config
 
 # constant neighbor offsets
@@ -55,6 +69,110 @@ neighbor_offsets_index = {
 }
 
 
+# Flat player indices: player (x, y) is represented by the index x * N + y.
+def player_index(x, y):
+    return x * N + y
+
+
+def player_coordinates(player):
+    return divmod(player, N)
+
+
+# slotOfOffset[dx + 1, dy + 1] is the slot of the neighbor at offset (dx, dy)
+slotOfOffset = np.zeros((3, 3), int)
+for (ox, oy), slot in neighbor_offsets_index.items():
+    slotOfOffset[ox + 1, oy + 1] = slot
+
+
+# Build the tables of neighbors for the flat player indices:
+#  - neighborTable[p, k] is the k-th neighbor (in the order of neighbor_offsets) of p,
+#  - reverseSlotTable[p, k] is the slot of p in the neighbor list of neighborTable[p, k],
+#  - expandedIndexTable[p, k] is the flat index of the cell of the 3N x 3N
+#    expanded matrices (like lastAction) that shows p's view of its k-th neighbor,
+#  - expandedCenterIndex[p] is the flat index of p's own cell in these matrices.
+# (the rows of the given players)
+def build_neighbor_tables(n, players):
+    xs, ys = np.divmod(players, n)
+    offsets = np.array(neighbor_offsets)
+    nx = (xs[:, None] + offsets[None, :, 0]) % n
+    ny = (ys[:, None] + offsets[None, :, 1]) % n
+    neighbors = nx * n + ny
+
+    # the slot of p as seen from the neighbor,
+    # computed with the same wrap-around rule as the offsets
+    diffx = xs[:, None] - nx
+    diffy = ys[:, None] - ny
+    diffx = np.where(diffx > 1, -1, np.where(diffx < -1, 1, diffx))
+    diffy = np.where(diffy > 1, -1, np.where(diffy < -1, 1, diffy))
+    reverseSlots = slotOfOffset[diffx + 1, diffy + 1]
+
+    expandedCenter = (3 * xs + 1) * (3 * n) + 3 * ys + 1
+    expanded = (
+        expandedCenter[:, None] + offsets[None, :, 0] * (3 * n) + offsets[None, :, 1]
+    )
+    return neighbors, reverseSlots, expanded, expandedCenter
+
+
+# The tables are built in chunks of rows, so that the temporary arrays stay small
+# (with --memmap-state, the tables themselves are memory-mapped)
+neighborTableChunk = 65536
+neighborTable = state_array("neighborTable", (N * N, 8), indexInt)
+reverseSlotTable = state_array("reverseSlotTable", (N * N, 8), np.int8)
+expandedIndexTable = state_array("expandedIndexTable", (N * N, 8), indexInt)
+expandedCenterIndex = state_array("expandedCenterIndex", (N * N,), indexInt)
+for start in range(0, N * N, neighborTableChunk):
+    rows = slice(start, min(start + neighborTableChunk, N * N))
+    (
+        neighborTable[rows],
+        reverseSlotTable[rows],
+        expandedIndexTable[rows],
+        expandedCenterIndex[rows],
+    ) = build_neighbor_tables(N, np.arange(rows.start, rows.stop))
+
+# List versions of the tables for the scalar code paths; indexing python lists
+# is several times faster than indexing numpy arrays with scalars, but the lists
+# take about 800 bytes per player (several times the arrays), so they are only
+# built (by build_scalar_tables) once a scalar code path is used, and only for
+# lattices of at most scalarTablesMaxPlayers players that are not memory-mapped.
+# Otherwise, TableRows converts just the rows that are accessed (so that with
+# --memmap-state, the scalar code paths read the memory-mapped tables).
+scalarTablesMaxPlayers = 2**18
+neighborLists = None
+reverseSlotLists = None
+expandedIndexLists = None
+expandedCenterList = None
+
+
+# The rows of a table as python lists, converted when they are accessed
+# (for a one-dimensional table, the entries as python ints)
+class TableRows:
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, index):
+        return self.table[index].tolist()
+
+
+def build_scalar_tables():
+    global neighborLists, reverseSlotLists, expandedIndexLists, expandedCenterList
+    if neighborLists is not None:
+        return
+    if N * N <= scalarTablesMaxPlayers and not mapState:
+        neighborLists = neighborTable.tolist()
+        reverseSlotLists = reverseSlotTable.tolist()
+        expandedIndexLists = expandedIndexTable.tolist()
+        expandedCenterList = expandedCenterIndex.tolist()
+    else:
+        neighborLists = TableRows(neighborTable)
+        reverseSlotLists = TableRows(reverseSlotTable)
+        expandedIndexLists = TableRows(expandedIndexTable)
+        expandedCenterList = TableRows(expandedCenterIndex)
+
+# Flat views of the matrices (sharing memory with them)
+strategiesFlat = strategies.reshape(-1)
+reputationFlat = {}  # initialized in config
+
+
 #   ____ ____ _  _ ___  ____ _  _    _  _ _  _ _  _ ___  ____ ____ ____
 #   |__/ |__| |\ | |  \ |  | |\/|    |\ | |  | |\/| |__] |___ |__/ [__
 #   |  \ |  | | \| |__/ |__| |  |    | \| |__| |  | |__] |___ |  \ ___]
@@ -86,11 +204,29 @@ if seed is None:
 
     seed = int(time.time() * 256) % (2**32)  # use fractional seconds
 
-duelSelectionRandom = random.Random(seed)
+# the random numbers of the duels are drawn in bulk with --rng numpy
+if args.rng == "numpy":
+    duelSelectionRandom = rng.BufferedRandom(seed)
+else:
+    duelSelectionRandom = random.Random(seed)
+# the random decisions of the scalar duels, by purpose
+if args.rng == "counter":
+    duelRandom = rng.CounterRandom(seed, N)
+else:
+    duelRandom = rng.DuelRandom(duelSelectionRandom, N)
 reputationNoiseRandom = random.Random(seed + 1)
-initialStateRandom = random.Random(seed + 2)
-
-# Set seed also for numpy's random, which is used by scipy.stats as well
+# The numpy generators are seeded with [seed, purpose], which keeps the streams
+# of all seeds and purposes apart (with seed + purpose, the initial state of
+# seed s would be drawn from the duel stream of seed s + 1)
+initialStatePurpose = 5
+batchedDuelPurpose = 4
+parallelWorkerPurpose = 6
+# numpy generator for the vectorized initial state creation (see strategy_init)
+initialStateGenerator = np.random.default_rng([seed, initialStatePurpose])
+# numpy generator for the random draws of the batched and synchronous engines
+batchedDuelRandom = np.random.default_rng([seed, batchedDuelPurpose])
+
+# Set seed also for numpy's (legacy) global random generator
 np.random.seed(seed + 3)
 
 # Info about initial state,
@@ -101,6 +237,6 @@ occurringStrategies = set([])
 occurringMorals = set([])
 occurringInterestingMorals = set([])
 
-# special player constants
-HEAVEN = (-1, -1)
-HELL = (-666, -666)
+# special player constants (flat indices outside of the lattice)
+HEAVEN = -1
+HELL = -666
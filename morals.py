@@ -15,7 +15,8 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from misc_globals import N
+from misc_globals import N, stateInt
+from memmap_state import state_array
 
 # Define different morals
 saferep = 1
@@ -38,10 +39,12 @@ laFamilia2 = 16
 # polarization seed = 0 if moral in polarizationSeedScepticMorals else 1
 polarizationSeedScepticMorals = [saferep, liberal2, safedirep2]
 
+# the last action against good/bad players, indexed by flat player index
 saferepAgainstGoodBits = {}
 saferepAgainstBadBits = {}
 
-# in kandoryHistory, we store for each general kandori1 moral a NxN array of kandori1 states
+# in kandoryHistory, we store for each general kandori1 moral an array of kandori1 states
+# (indexed by flat player index)
 # the states are in {-T,...,-1,0}, where T is given by kandoriPenaltyLoop[moral]
 # Semantics of the values:
 #    = 0  means good,
@@ -72,7 +75,6 @@ moralNames = {
 uninterestingMorals = [dontCare, laFamilia]
 
 import games_and_strategies
-import numpy as np
 
 initialAgainstGoodAction = {
     saferep: games_and_strategies.cooperate,
@@ -104,35 +106,50 @@ kandoriPenaltyLoop = {
 
 
 def initSaferep(moral, strategies):
-    saferepAgainstGoodBits[moral] = (
-        np.ones((N, N), int) * initialAgainstGoodAction[moral]
+    saferepAgainstGoodBits[moral] = state_array(
+        "saferepAgainstGoodBits-" + moralNames[moral],
+        (N * N,),
+        stateInt,
+        initialAgainstGoodAction[moral],
+    )
+    saferepAgainstBadBits[moral] = state_array(
+        "saferepAgainstBadBits-" + moralNames[moral],
+        (N * N,),
+        stateInt,
+        initialAgainstBadAction[moral],
     )
-    saferepAgainstBadBits[moral] = np.ones((N, N), int) * initialAgainstBadAction[moral]
     initialRep = (
         1
         if initialAgainstGoodAction[moral] == games_and_strategies.cooperate
         and initialAgainstBadAction[moral] == games_and_strategies.defect
         else 0
     )
-    return np.zeros((N, N), int) + initialRep
+    return state_array(
+        "reputation-" + moralNames[moral], (N, N), stateInt, initialRep
+    )
 
 
 def initKandori(moral, strategies):
-    kandoriHistory[moral] = np.zeros((N, N), int) - kandoriPenaltyLoop[moral]
+    kandoriHistory[moral] = state_array(
+        "kandoriHistory-" + moralNames[moral],
+        (N * N,),
+        stateInt,
+        -kandoriPenaltyLoop[moral],
+    )
     if moral == kandoriInitiallyGood:
         kandoriHistory[moral][:] = 0  # hack all to start as good
-        return np.ones((N, N), int)
-    return np.zeros((N, N), int)
+        return state_array("reputation-" + moralNames[moral], (N, N), stateInt, 1)
+    return state_array("reputation-" + moralNames[moral], (N, N), stateInt)
 
 
 def initLaFamilia(moral, strategies):
-    rep = np.zeros((N, N), int)
+    rep = state_array("reputation-" + moralNames[moral], (N, N), stateInt)
     rep[:] = strategies == games_and_strategies.mafia
     return rep
 
 
 def initLaFamilia2(moral, strategies):
-    rep = np.zeros((N, N), int)
+    rep = state_array("reputation-" + moralNames[moral], (N, N), stateInt)
     rep[:] = strategies == games_and_strategies.mafia2
     return rep
 
@@ -161,7 +178,9 @@ initMoral = {
     kandoriInitiallyGood: initKandori,
     laFamilia: initLaFamilia,
     laFamilia2: initLaFamilia2,
-    dontCare: lambda moral, strategies: np.zeros((N, N), int),
+    dontCare: lambda moral, strategies: state_array(
+        "reputation-" + moralNames[moral], (N, N), stateInt
+    ),
     safedirep: initSafedirep,
     safedirep2: initSafedirep,
     smartMafia: smart_mafia.init_reputation,
@@ -190,3 +209,44 @@ newReputation = {
     safedirep2: reputation_updates.saferep,
     smartMafia: smart_mafia.update_reputation,
 }
+
+# The same functions for arrays of (distinct) players, see reputation_updates
+newReputationVectorized = {
+    saferep: reputation_updates.saferepVectorized,
+    liberal: reputation_updates.saferepVectorized,
+    liberal2: reputation_updates.saferepVectorized,
+    saferep2: reputation_updates.saferepVectorized,
+    dontCare: reputation_updates.amoralVectorized,
+    kandori1: reputation_updates.genericKandoriVectorized,
+    laFamilia: reputation_updates.neverBetrayTheFamilyVectorized,
+    laFamilia2: reputation_updates.neverBetrayTheOtherFamilyVectorized,
+    kandori2: reputation_updates.genericKandoriVectorized,
+    kandori3: reputation_updates.genericKandoriVectorized,
+    kandori8: reputation_updates.genericKandoriVectorized,
+    kandori9: reputation_updates.genericKandoriVectorized,
+    kandoriInitiallyGood: reputation_updates.genericKandoriVectorized,
+    safedirep: reputation_updates.saferepVectorized,
+    safedirep2: reputation_updates.saferepVectorized,
+    smartMafia: smart_mafia.update_reputations,
+}
+
+# Whether the updates leave the reputation and the state of the moral
+# unchanged, for arrays of players (see reputation_updates)
+reputationIsFixedPoint = {
+    saferep: reputation_updates.saferepFixedPoint,
+    liberal: reputation_updates.saferepFixedPoint,
+    liberal2: reputation_updates.saferepFixedPoint,
+    saferep2: reputation_updates.saferepFixedPoint,
+    dontCare: reputation_updates.amoralFixedPoint,
+    kandori1: reputation_updates.genericKandoriFixedPoint,
+    laFamilia: reputation_updates.neverBetrayTheFamilyFixedPoint,
+    laFamilia2: reputation_updates.neverBetrayTheOtherFamilyFixedPoint,
+    kandori2: reputation_updates.genericKandoriFixedPoint,
+    kandori3: reputation_updates.genericKandoriFixedPoint,
+    kandori8: reputation_updates.genericKandoriFixedPoint,
+    kandori9: reputation_updates.genericKandoriFixedPoint,
+    kandoriInitiallyGood: reputation_updates.genericKandoriFixedPoint,
+    safedirep: reputation_updates.saferepFixedPoint,
+    safedirep2: reputation_updates.saferepFixedPoint,
+    smartMafia: smart_mafia.is_fixed_point,
+}
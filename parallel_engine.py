@@ -0,0 +1,221 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+from multiprocessing import get_context, shared_memory
+
+from misc_globals import N, seed
+from state_snapshot import moralStates, state_arrays
+
+import misc_globals
+import config
+import display_config
+import safedirep
+import batched_engine
+import implementation
+
+# Parallel engine: the torus is split into bands of rows (tiles spanning the
+# whole width), each owned by a worker process, and the state lives in shared
+# memory. Every band consists of an upper and a lower half of at least 4 rows.
+# A round has two phases: first all workers play duels with focals in the upper
+# halves of their bands, then in the lower halves. A duel only reads and writes
+# the state of players within distance 2 of focal, so duels in the active
+# halves of different bands never touch the same players (the inactive halves
+# between them are the halos), and no locking or exchange at the band borders
+# is needed; the master only synchronizes the phases. Within a phase, a worker
+# plays its duels like the batched engine, in an order equivalent to drawing
+# them one after another. Unlike the other engines, the phases constrain where
+# the duels of a round happen, so the trajectories only approximately follow
+# the distribution of the sequential engine (the shorter the phases, the
+# better).
+# The workers are forked after the initialization; they install the shared
+# state in place of their own, while the master keeps its arrays (which other
+# modules import by name) and copies the shared state into them when the UI,
+# the statistics, the termination conditions or the end of the run need it.
+# Instead of tiles exchanging halos, the bands synchronize twice per round. A
+# round has about N * N / 8 duels, but never plays past a refresh, so rounds
+# only get that long with -r of at least N * N / 8 iterations. With the
+# default -r 1000 at N = 200, the per-round overhead made a run 25% slower
+# than with -r 100000 (one worker, on one CPU).
+
+# At most one band per 8 rows
+numberOfWorkers = max(1, min(config.numberOfWorkers, N // 8))
+bandStarts = [N * w // numberOfWorkers for w in range(numberOfWorkers + 1)]
+
+# The rows [first, last) of the halves of the bands, by phase and worker
+halves = [[], []]
+for first, last in zip(bandStarts, bandStarts[1:]):
+    halves[0].append((first, (first + last) // 2))
+    halves[1].append(((first + last) // 2, last))
+
+# The number of duels per player of the active halves in a phase
+duelsPerPlayerAndPhase = 0.125
+
+# The shared state (by key, see state_snapshot.state_arrays), its shared
+# memory blocks, and the connections to the workers
+sharedState = {}
+sharedMemories = []
+connections = []
+workers = []
+
+
+# Copy the state into shared memory and fork the workers
+def start_workers():
+    for key, array in state_arrays().items():
+        memory = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        sharedMemories.append(memory)
+        sharedState[key] = np.ndarray(array.shape, array.dtype, memory.buf)
+        sharedState[key][...] = array
+
+    context = get_context("fork")
+    for w in range(numberOfWorkers):
+        connection, workerConnection = context.Pipe()
+        worker = context.Process(target=work, args=(w, workerConnection), daemon=True)
+        worker.start()
+        connections.append(connection)
+        workers.append(worker)
+
+
+def stop_workers():
+    gather_state()
+    for connection in connections:
+        connection.send(None)
+    for worker in workers:
+        worker.join()
+    for memory in sharedMemories:
+        memory.close()
+        memory.unlink()
+    del connections[:], workers[:], sharedMemories[:]
+    sharedState.clear()
+
+
+# Copy the shared state into the arrays of the master
+def gather_state():
+    for key, array in state_arrays().items():
+        np.copyto(array, sharedState[key])
+
+
+# Copy the parts of the shared state that the termination conditions read (see
+# implementation.termination_reasons) into the arrays of the master; the strategy
+# counts are kept up to date by the master itself
+def gather_termination_state():
+    if (
+        config.terminateWhenDiscReachesBoundary
+        or config.terminateWhenAllCReachesBoundary
+    ):
+        np.copyto(misc_globals.strategies, sharedState["strategies"])
+    if config.terminateWhenRepConstant:
+        moral = display_config.guiMoral
+        np.copyto(misc_globals.reputation[moral], sharedState["reputation", moral])
+
+
+# Play a round (both phases) of at most maxDuels duels; returns the number of
+# played duels and the number of duels that changed a strategy
+def run_duels(maxDuels):
+    counts = np.array(
+        [
+            [
+                max(1, round((last - first) * N * duelsPerPlayerAndPhase))
+                for first, last in halves[phase]
+            ]
+            for phase in range(2)
+        ]
+    )
+    total = counts.sum()
+    if total > maxDuels:
+        counts = (counts * maxDuels) // total
+        counts.flat[: maxDuels - counts.sum()] += 1
+
+    duels = changes = 0
+    for phase in range(2):
+        for connection, count in zip(connections, counts[phase].tolist()):
+            connection.send((phase, count))
+        for connection in connections:
+            played, takeovers = connection.recv()
+            duels += played
+            changes += len(takeovers)
+            for oldStrategy, newStrategy in takeovers:
+                implementation.record_takeover(oldStrategy, newStrategy)
+    return duels, changes
+
+
+# The main function of worker w: play the duels of the phases the master asks for
+def work(w, connection):
+    install_state()
+    rand = np.random.default_rng([seed, misc_globals.parallelWorkerPurpose, w])
+    while True:
+        command = connection.recv()
+        if command is None:
+            break
+        phase, count = command
+        first, last = halves[phase][w]
+        connection.send(play_phase(first * N, (last - first) * N, count, rand))
+    connection.close()
+
+
+# Use the shared state instead of the own copy (in a worker)
+def install_state():
+    misc_globals.strategies = sharedState["strategies"]
+    misc_globals.strategiesFlat = misc_globals.strategies.reshape(-1)
+    implementation.edgeActions = sharedState["edgeActions"]
+    implementation.edgeActionsFlat = implementation.edgeActions.reshape(-1, 8)
+    implementation.edgeActionsByEdge = implementation.edgeActions.reshape(-1)
+    implementation.scores = sharedState["scores"]
+    implementation.scoresFlat = implementation.scores.reshape(-1)
+    if display_config.showLastActionMatrix:
+        implementation.lastAction = sharedState["lastAction"]
+        implementation.lastActionFlat = implementation.lastAction.reshape(-1)
+    for key, array in sharedState.items():
+        if isinstance(key, tuple):
+            name, moral = key
+            moralStates[name][moral] = array
+    for moral in misc_globals.reputation:
+        misc_globals.reputationFlat[moral] = misc_globals.reputation[moral].reshape(-1)
+    for moral in safedirep.againstPlayerBits:
+        safedirep.againstPlayerBitsFlat[moral] = safedirep.againstPlayerBits[
+            moral
+        ].reshape(N * N, 8)
+        safedirep.visualMatrixFlat[moral] = safedirep.visualMatrix[moral].reshape(-1)
+
+
+# Play count random duels with focals among the players offset, ..., offset +
+# size - 1 (a half of a band), in windows as the batched engine does; returns
+# the number of played duels and the (old, new) strategies of the takeovers
+def play_phase(offset, size, count, rand):
+    windowSize = min(batched_engine.windowSize, max(16, size // 64))
+    pendingDuels = batched_engine.draw_duels(0, rand)
+    takeovers = []
+    drawn = 0
+    while drawn < count or len(pendingDuels[0]):
+        newCount = min(windowSize - len(pendingDuels[0]), count - drawn)
+        drawn += newCount
+        focals = offset + rand.integers(0, size, newCount)
+        newDuels = (focals,) + batched_engine.draw_duels(newCount, rand)[1:]
+        window = [np.concatenate(fields) for fields in zip(pendingDuels, newDuels)]
+
+        selected = batched_engine.independent_duels(window[0])
+        pendingDuels = tuple(field[~selected] for field in window)
+        takenOver, oldStrategies = batched_engine.play_duels(
+            *[field[selected] for field in window]
+        )
+        takeovers.extend(
+            zip(
+                oldStrategies.tolist(),
+                misc_globals.strategiesFlat[takenOver].tolist(),
+            )
+        )
+    return count, takeovers
@@ -0,0 +1,300 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import time
+import numpy as np
+from cmdline_args import args
+
+from misc_globals import (
+    N,
+    M,
+    seed,
+    reputation,
+    reputationFlat,
+    occurringStrategies,
+    occurringStrategiesNames,
+    occurringMorals,
+    occurringInterestingMorals,
+)
+
+import misc_globals
+import config
+import display_config
+import morals
+import safedirep
+import games_and_strategies
+import stats as statistics
+import implementation
+import batched_engine
+
+# The replica engine simulates R independent replicas of the lattice at once.
+# The strategies and reputations of all replicas are stacked along a leading
+# replica axis (R x N x N) and installed in place of the state of a single
+# lattice; player p of replica r gets the flat index r * N * N + p, and the
+# neighbor tables are stacked accordingly. Duels of different replicas never
+# interact, so every iteration plays one duel in each running replica at once
+# with the vectorized kernels of the batched engine. Every replica thus follows
+# the sequential dynamics, with the random numbers of its own generator.
+
+R = config.numberOfReplicas
+playersPerReplica = N * N
+replicaOffsets = np.arange(R) * playersPerReplica
+
+# Replica r starts from the initial state of seed + r
+# and draws its duels from its own generator
+replicaSeeds = [seed + r for r in range(R)]
+replicaRandoms = [
+    np.random.default_rng([replicaSeed, misc_globals.batchedDuelPurpose])
+    for replicaSeed in replicaSeeds
+]
+
+# The random numbers of the replicas are drawn for bufferSize iterations at once
+bufferSize = 1024
+
+# The number of players per replica and strategy (R x numberOfStrategyIds),
+# and the number of strategies occurring initially in each replica
+strategyCounts = None
+initiallyAliveStrategies = None
+
+
+def main():
+    startEpochSeconds = time.time()
+    print("Starting [" + str(time.asctime()) + "]")
+
+    init_replicas()
+    config.store_configuration(
+        [occurringStrategiesNames[strategy] for strategy in sorted(occurringStrategies)]
+    )
+
+    if not config.disableReputationInitializationRounds:
+        init_reputation()
+        print('"Initialized" reputation, starting real game')
+    implementation.compute_edge_actions()
+    implementation.compute_scores()
+
+    duels, reasons = simulation()
+    store_summary(duels, reasons)
+
+    print("Done! [" + str(time.asctime()) + "]")
+    print("      Took " + str(time.time() - startEpochSeconds) + "s")
+
+
+# Create the initial states of all replicas and install the stacked state
+def init_replicas():
+    global strategyCounts, initiallyAliveStrategies
+
+    # initial strategies, as for a single run with the seed of the replica
+    replicaStrategies = np.zeros((R, N, N), misc_globals.stateInt)
+    for r, replicaSeed in enumerate(replicaSeeds):
+        misc_globals.initialStateGenerator = np.random.default_rng(
+            [replicaSeed, misc_globals.initialStatePurpose]
+        )
+        np.random.seed(replicaSeed + 3)
+        misc_globals.strategies[:] = 0
+        config.initializeStrategies()
+        replicaStrategies[r] = misc_globals.strategies
+    np.random.seed(config.mainLoopNumpySeed)
+
+    # strategies and morals occurring in any replica
+    for strategy in np.unique(replicaStrategies).tolist():
+        occurringStrategies.add(strategy)
+        occurringStrategiesNames[strategy] = games_and_strategies.strategyName[strategy]
+        moral = games_and_strategies.strategyMoral[strategy]
+        occurringMorals.add(moral)
+        if moral not in morals.uninterestingMorals:
+            occurringInterestingMorals.add(moral)
+
+    # initial reputations (and the state of the reputation updates) per replica
+    for moral in occurringMorals:
+        replicaReputations = []
+        goodBits, badBits, histories, againstBits, visualMatrices = [], [], [], [], []
+        for r in range(R):
+            replicaReputations.append(
+                morals.initMoral[moral](moral, replicaStrategies[r])
+            )
+            if moral in morals.saferepAgainstGoodBits:
+                goodBits.append(morals.saferepAgainstGoodBits[moral].copy())
+                badBits.append(morals.saferepAgainstBadBits[moral].copy())
+            if moral in morals.kandoriHistory:
+                histories.append(morals.kandoriHistory[moral].copy())
+            if moral in safedirep.againstPlayerBits:
+                againstBits.append(safedirep.againstPlayerBits[moral].copy())
+                visualMatrices.append(safedirep.visualMatrix[moral].copy())
+
+        reputation[moral] = np.stack(replicaReputations)
+        reputationFlat[moral] = reputation[moral].reshape(-1)
+        if goodBits:
+            morals.saferepAgainstGoodBits[moral] = np.concatenate(goodBits)
+            morals.saferepAgainstBadBits[moral] = np.concatenate(badBits)
+        if histories:
+            morals.kandoriHistory[moral] = np.concatenate(histories)
+        if againstBits:
+            safedirep.againstPlayerBits[moral] = np.stack(againstBits)
+            safedirep.againstPlayerBitsFlat[moral] = safedirep.againstPlayerBits[
+                moral
+            ].reshape(-1, 8)
+            safedirep.visualMatrix[moral] = np.stack(visualMatrices)
+            safedirep.visualMatrixFlat[moral] = safedirep.visualMatrix[
+                moral
+            ].reshape(-1)
+
+    # stacked strategies and neighbor tables
+    misc_globals.strategies = replicaStrategies
+    misc_globals.strategiesFlat = replicaStrategies.reshape(-1)
+    offsets = replicaOffsets[:, None, None]
+    expandedOffsets = 9 * replicaOffsets[:, None, None]
+    misc_globals.neighborTable = (misc_globals.neighborTable + offsets).reshape(-1, 8)
+    misc_globals.reverseSlotTable = np.tile(misc_globals.reverseSlotTable, (R, 1))
+    misc_globals.expandedIndexTable = (
+        misc_globals.expandedIndexTable + expandedOffsets
+    ).reshape(-1, 8)
+    misc_globals.expandedCenterIndex = (
+        misc_globals.expandedCenterIndex + expandedOffsets[:, :, 0]
+    ).reshape(-1)
+    implementation.allocate_caches((R, N, N))
+
+    strategyCounts = np.zeros((R, games_and_strategies.numberOfStrategyIds), int)
+    for r in range(R):
+        strategyCounts[r] = np.bincount(
+            replicaStrategies[r].ravel(), minlength=strategyCounts.shape[1]
+        )
+    initiallyAliveStrategies = np.count_nonzero(strategyCounts, axis=1)
+
+
+# Draw the random numbers of the next bufferSize iterations of all replicas;
+# draw(count, rand) returns a tuple of arrays with count rows. The result
+# holds the same fields with shape bufferSize x R x ...
+def draw_buffered(draw):
+    perReplica = [draw(bufferSize, rand) for rand in replicaRandoms]
+    return [np.stack(field, axis=1) for field in zip(*perReplica)]
+
+
+# "Initialize" reputation by playing a few rounds without strategy updates
+def init_reputation():
+    for step in range(config.numberOfReputationInitializationRounds):
+        t = step % bufferSize
+        if t == 0:
+            # pairs of players within a replica
+            pairs = draw_buffered(batched_engine.draw_rep_init_pairs)
+        batched_engine.play_duels_without_strategy_update(
+            pairs[0][t] + replicaOffsets,
+            pairs[1][t] + replicaOffsets,
+            args.polarization_seed and step == 0,
+        )
+
+
+# The main loop: play one duel in every running replica per iteration;
+# returns the number of duels played and the termination reason of each replica
+def simulation():
+    running = np.ones(R, bool)
+    duels = np.zeros(R, int)
+    reasons = np.full(R, "", object)
+
+    for iteration in range(M):
+        if iteration > 0 and iteration % display_config.stepsBetweenRefresh == 0:
+            print(
+                "Iteration "
+                + str(iteration)
+                + " of "
+                + str(M)
+                + " ("
+                + ("%f" % (100.0 * iteration / M))
+                + "%), "
+                + str(np.count_nonzero(running))
+                + " of "
+                + str(R)
+                + " replicas running"
+            )
+
+            # Give the termination conditions a chance, even if no strategies change
+            if iteration > 1000:
+                terminate(np.flatnonzero(running), running, reasons)
+                if not np.any(running):
+                    break
+
+        t = iteration % bufferSize
+        if t == 0:
+            duelRandoms = draw_buffered(batched_engine.draw_duels)
+
+        replicas = np.flatnonzero(running)
+        focals, chosenSlots, replicatorRandoms, orders, contactRandoms = [
+            field[t][replicas] for field in duelRandoms
+        ]
+        takenOver, oldStrategies = batched_engine.play_duels(
+            focals + replicaOffsets[replicas],
+            chosenSlots,
+            replicatorRandoms,
+            orders,
+            contactRandoms,
+        )
+        duels[replicas] += 1
+
+        if len(takenOver) > 0:
+            changedReplicas = takenOver // playersPerReplica
+            np.subtract.at(strategyCounts, (changedReplicas, oldStrategies), 1)
+            np.add.at(
+                strategyCounts,
+                (changedReplicas, misc_globals.strategiesFlat[takenOver]),
+                1,
+            )
+            terminate(changedReplicas, running, reasons)
+            if not np.any(running):
+                break
+
+    return duels, reasons
+
+
+# Check the termination conditions (see implementation.termination_reasons)
+# for the given replicas and stop the replicas that are done
+def terminate(replicas, running, reasons):
+    guiReputations = None
+    if config.terminateWhenRepConstant:
+        guiReputations = reputation[display_config.guiMoral][replicas]
+    replicaReasons = implementation.termination_reasons(
+        misc_globals.strategies[replicas],
+        guiReputations,
+        np.count_nonzero(strategyCounts[replicas], axis=1),
+        initiallyAliveStrategies[replicas],
+    )
+    done = replicaReasons != ""
+    running[replicas[done]] = False
+    reasons[replicas[done]] = replicaReasons[done]
+
+
+# Write the seed, the number of duels, the termination reason and the final
+# number of players per strategy of every replica to replicas.csv
+def store_summary(duels, reasons):
+    sep = statistics.csvSep
+    strategies = sorted(occurringStrategies)
+    summaryFile = open(config.foldername + os.sep + "replicas.csv", "w")
+    summaryFile.write(
+        sep.join(
+            ["Replica", "Seed", "#duels", "Termination"]
+            + ["#players " + occurringStrategiesNames[s] for s in strategies]
+        )
+        + os.linesep
+    )
+    for r in range(R):
+        summaryFile.write(
+            sep.join(
+                [str(r), str(replicaSeeds[r]), str(duels[r]), reasons[r]]
+                + [str(strategyCounts[r, s]) for s in strategies]
+            )
+            + os.linesep
+        )
+    summaryFile.close()
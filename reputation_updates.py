@@ -15,7 +15,9 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from misc_globals import strategies
+import numpy as np
+from misc_globals import strategiesFlat
+import misc_globals
 from games_and_strategies import cooperate, defect, mafia, mafia2
 import morals
 
@@ -69,9 +71,77 @@ def genericKandori(me, moral, my_old_rep, her_old_rep, my_action):
 #
 def neverBetrayTheFamily(me, moral, my_old_rep, her_old_rep, my_action):
     # no matter what you do and whom you met, all that counts is the family
-    return 1 if strategies[me] == mafia else 0
+    return 1 if strategiesFlat[me] == mafia else 0
 
 
 def neverBetrayTheOtherFamily(me, moral, my_old_rep, her_old_rep, my_action):
     # no matter what you do and whom you met, all that counts is the family
-    return 1 if strategies[me] == mafia2 else 0
+    return 1 if strategiesFlat[me] == mafia2 else 0
+
+
+# Versions of the updates above for whole arrays of (distinct) players,
+# used by the batched engine. The arguments are arrays of equal length;
+# the strategies are looked up in misc_globals when called (see vectorized).
+def amoralVectorized(me, moral, my_old_rep, her_old_rep, my_action):
+    return np.zeros(len(me), int)
+
+
+def saferepVectorized(me, moral, my_old_rep, her_old_rep, my_action):
+    good = her_old_rep >= 0.5
+    goodBits = morals.saferepAgainstGoodBits[moral]
+    badBits = morals.saferepAgainstBadBits[moral]
+    goodBits[me[good]] = my_action[good]
+    badBits[me[~good]] = my_action[~good]
+    return ((goodBits[me] == cooperate) & (badBits[me] == defect)) * 1
+
+
+def genericKandoriVectorized(me, moral, my_old_rep, her_old_rep, my_action):
+    good = her_old_rep >= 0.5
+    compliant = (good & (my_action == cooperate)) | (~good & (my_action == defect))
+    history = morals.kandoriHistory[moral]
+    history[me] = np.where(
+        compliant,
+        np.minimum(0, history[me] + 1),
+        -morals.kandoriPenaltyLoop[moral],
+    )
+    return (history[me] == 0) * 1
+
+
+def neverBetrayTheFamilyVectorized(me, moral, my_old_rep, her_old_rep, my_action):
+    return (misc_globals.strategiesFlat[me] == mafia) * 1
+
+
+def neverBetrayTheOtherFamilyVectorized(me, moral, my_old_rep, her_old_rep, my_action):
+    return (misc_globals.strategiesFlat[me] == mafia2) * 1
+
+
+# Whether the updates above leave the reputation (my_old_rep, the stored one)
+# and the state of the moral of the players unchanged; used by the kinetic
+# engine to find the duels that cannot change anything.
+def amoralFixedPoint(me, moral, my_old_rep, her_old_rep, my_action):
+    return my_old_rep == 0
+
+
+def saferepFixedPoint(me, moral, my_old_rep, her_old_rep, my_action):
+    goodBits = morals.saferepAgainstGoodBits[moral][me]
+    badBits = morals.saferepAgainstBadBits[moral][me]
+    storedAction = np.where(her_old_rep >= 0.5, goodBits, badBits)
+    newRep = ((goodBits == cooperate) & (badBits == defect)) * 1
+    return (storedAction == my_action) & (newRep == my_old_rep)
+
+
+def genericKandoriFixedPoint(me, moral, my_old_rep, her_old_rep, my_action):
+    good = her_old_rep >= 0.5
+    compliant = (good & (my_action == cooperate)) | (~good & (my_action == defect))
+    history = morals.kandoriHistory[moral][me]
+    return np.where(
+        compliant, history == 0, history == -morals.kandoriPenaltyLoop[moral]
+    ) & ((history == 0) * 1 == my_old_rep)
+
+
+def neverBetrayTheFamilyFixedPoint(me, moral, my_old_rep, her_old_rep, my_action):
+    return (misc_globals.strategiesFlat[me] == mafia) * 1 == my_old_rep
+
+
+def neverBetrayTheOtherFamilyFixedPoint(me, moral, my_old_rep, her_old_rep, my_action):
+    return (misc_globals.strategiesFlat[me] == mafia2) * 1 == my_old_rep
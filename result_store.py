@@ -0,0 +1,95 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import hashlib
+import os
+import shutil
+import sys
+
+from cmdline_args import args, result_parameter_lines
+from misc_globals import seed
+
+# The content-addressed result store (--store): the results of a run are kept
+# in the subfolder of the store named by the hash of everything that determines
+# them, i.e., the parameters (see cmdline_args.result_parameter_lines), the seed
+# and the source code of the simulator. A run whose subfolder exists is not
+# repeated; a run writes to a temporary subfolder that is renamed when it is
+# done, so interrupted runs never count as stored.
+
+storeFolder = args.store
+packageDirectory = os.path.dirname(os.path.abspath(__file__))
+
+
+# The hash of the source code of the simulator (all Python files of the package)
+def source_version():
+    sourceHash = hashlib.sha256()
+    for name in sorted(os.listdir(packageDirectory)):
+        if name.endswith(".py"):
+            sourceHash.update(name.encode())
+            with open(os.path.join(packageDirectory, name), "rb") as sourceFile:
+                sourceHash.update(sourceFile.read())
+    return sourceHash.hexdigest()
+
+
+# The name of the subfolder of the results of this run
+def result_key():
+    lines = result_parameter_lines(args)
+    lines.append("random seed = " + str(seed))
+    lines.append("source version = " + source_version())
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+if storeFolder is not None:
+    resultFolder = os.path.join(storeFolder, result_key())
+    incompleteFolder = resultFolder + ".incomplete-" + str(os.getpid())
+
+
+# Link the output folder (if given) to the stored results
+def link_output_folder():
+    if args.output_folder is not None:
+        os.symlink(os.path.abspath(resultFolder), args.output_folder)
+
+
+# Whether the results of this run are stored already; then the output folder is
+# linked to them, or we exit with an error (--store-hit fail)
+def reuse_stored_results():
+    if storeFolder is None:
+        return False
+    if args.output_folder is not None and os.path.lexists(args.output_folder):
+        print("Folder " + str(args.output_folder) + " already exists! Exiting.")
+        sys.exit(2)
+    if not os.path.isdir(resultFolder):
+        return False
+    print("Results are stored already in " + os.path.abspath(resultFolder) + ".")
+    if args.store_hit == "fail":
+        print("Not repeating the run! Exiting.")
+        sys.exit(3)
+    link_output_folder()
+    return True
+
+
+# Move the results of the finished run into the store
+def publish_results():
+    if storeFolder is None:
+        return
+    try:
+        os.rename(incompleteFolder, resultFolder)
+    except OSError:
+        # stored by a concurrent run in the meantime
+        shutil.rmtree(incompleteFolder)
+    print("Stored results in " + os.path.abspath(resultFolder) + ".")
+    link_output_folder()
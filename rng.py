@@ -0,0 +1,283 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+# Random numbers for the scalar code paths, drawn in bulk from a numpy Generator.
+# BufferedRandom implements the part of the interface of random.Random used by
+# the simulation (random, randint, randrange, choice, shuffle, uniform), so it
+# can replace duelSelectionRandom. Each kind of draw (uniforms, integers of a
+# given range, permutations of a given length) has its own stream, which is
+# refilled with bufferSize numbers at once and consumed one by one.
+
+bufferSize = 1 << 16
+
+
+# An endless stream of the entries of the arrays returned by draw()
+def stream(draw):
+    while True:
+        yield from draw().tolist()
+
+
+class BufferedRandom:
+    def __init__(self, seed):
+        self.generator = np.random.default_rng(seed)
+        self.random = stream(lambda: self.generator.random(bufferSize)).__next__
+        self.belowStreams = {}
+        self.permutationStreams = {}
+
+    # a random integer in range(n)
+    def below(self, n):
+        nextBelow = self.belowStreams.get(n)
+        if nextBelow is None:
+            nextBelow = stream(lambda: self.generator.integers(0, n, bufferSize))
+            nextBelow = self.belowStreams[n] = nextBelow.__next__
+        return nextBelow()
+
+    def randint(self, a, b):
+        return a + self.below(b - a + 1)
+
+    def randrange(self, n):
+        return self.below(n)
+
+    def choice(self, seq):
+        return seq[self.below(len(seq))]
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    # the state of the generator; the buffered numbers are not part of it,
+    # setstate discards them
+    def getstate(self):
+        return self.generator.bit_generator.state
+
+    def setstate(self, state):
+        self.generator.bit_generator.state = state
+        self.random = stream(lambda: self.generator.random(bufferSize)).__next__
+        self.belowStreams.clear()
+        self.permutationStreams.clear()
+
+    # continue with the numbers of another seed (as random.Random.seed)
+    def seed(self, seed):
+        self.setstate(np.random.default_rng(seed).bit_generator.state)
+
+    def shuffle(self, x):
+        n = len(x)
+        nextPermutation = self.permutationStreams.get(n)
+        if nextPermutation is None:
+            nextPermutation = stream(
+                lambda: np.argsort(self.generator.random((bufferSize, n)), axis=1)
+            )
+            nextPermutation = self.permutationStreams[n] = nextPermutation.__next__
+        x[:] = [x[i] for i in nextPermutation()]
+
+
+# The random decisions of the scalar duels, by purpose. DuelRandom takes them from
+# a single stream (random.Random or BufferedRandom) in the order in which the
+# duel kernel has always drawn them; CounterRandom derives them from the index
+# of the duel instead.
+
+neighborSlots = list(range(8))
+
+
+class DuelRandom:
+    def __init__(self, rand, n):
+        self.rand = rand
+        self.n = n
+
+    def player(self):
+        x = self.rand.randint(0, self.n - 1)
+        y = self.rand.randint(0, self.n - 1)
+        return x * self.n + y
+
+    # focal player and slot of the chosen neighbor of the next duel
+    def focal_and_slot(self):
+        return self.player(), self.rand.choice(neighborSlots)
+
+    # uniform compared with the takeover probability
+    def replicator(self):
+        return self.rand.random()
+
+    # random orders of the neighbor updates of focal and chosen
+    def shuffle_orders(self, focalsOrder, chosenOrder):
+        self.rand.shuffle(focalsOrder)
+        self.rand.shuffle(chosenOrder)
+
+    # uniform compared with a heaven/hell contact probability (see contactRandoms
+    # in batched_engine.play_duels for the meaning of index)
+    def contact(self, index):
+        return self.rand.random()
+
+    # two different players for a global reputation initialization duel
+    def rep_init_players(self):
+        p1 = self.player()
+        p2 = self.player()
+        while p2 == p1:
+            p2 = self.player()
+        return p1, p2
+
+    # player and neighbor slot for a local reputation initialization duel
+    def rep_init_player_and_slot(self):
+        return self.player(), self.rand.choice(neighborSlots)
+
+
+# Counter-based random numbers: the numbers of duel k are a pure function of
+# (seed, k, purpose), no matter in which order or by which engine the duels are
+# played. The duels are divided into blocks of counterBlockSize; the numbers of
+# one purpose in one block are drawn from a Philox generator keyed by the seed
+# whose counter encodes block and purpose. Duels and reputation initialization
+# duels are counted separately.
+
+counterBlockSize = 4096
+
+focalPurpose = 0
+slotPurpose = 1
+replicatorPurpose = 2
+orderPurpose = 3
+contactPurpose = 4
+repInitPlayerPurpose = 5
+repInitPartnerPurpose = 6
+
+
+class CounterRandom:
+    def __init__(self, seed, n):
+        self.seed = seed
+        self.n = n
+        self.nextDuel = 0
+        self.nextRepInitDuel = 0
+        self.cachedBlock = None
+        self.scalarBlock = None
+        self.repInitBlock = None
+
+    def getstate(self):
+        return self.nextDuel, self.nextRepInitDuel
+
+    def setstate(self, state):
+        self.nextDuel, self.nextRepInitDuel = state
+
+    # continue with the numbers of another seed (the duels are still counted on)
+    def reseed(self, seed):
+        self.seed = seed
+        self.cachedBlock = None
+        self.scalarBlock = None
+        self.repInitBlock = None
+
+    def generator(self, block, purpose):
+        return np.random.Generator(
+            np.random.Philox(key=self.seed, counter=[0, 0, block, purpose])
+        )
+
+    # focals, chosen slots, replicator uniforms, update orders and contact uniforms
+    # of the duels of a block (the layout of batched_engine.draw_duels)
+    def duel_block(self, block):
+        if self.cachedBlock != block:
+            self.cachedBlock = block
+            self.cachedDuels = (
+                self.generator(block, focalPurpose).integers(
+                    0, self.n * self.n, counterBlockSize
+                ),
+                self.generator(block, slotPurpose).integers(0, 8, counterBlockSize),
+                self.generator(block, replicatorPurpose).random(counterBlockSize),
+                np.argsort(
+                    self.generator(block, orderPurpose).random(
+                        (counterBlockSize, 2, 8)
+                    ),
+                    axis=2,
+                ),
+                self.generator(block, contactPurpose).random((counterBlockSize, 4)),
+            )
+        return self.cachedDuels
+
+    # the numbers of the next count duels, for the batched engine
+    def duels(self, count):
+        first = self.nextDuel
+        self.nextDuel += count
+        blocks = range(
+            first // counterBlockSize,
+            (first + max(count, 1) - 1) // counterBlockSize + 1,
+        )
+        start = first - blocks[0] * counterBlockSize
+        parts = [self.duel_block(block) for block in blocks]
+        return tuple(
+            np.concatenate(numbers)[start : start + count] for numbers in zip(*parts)
+        )
+
+    def focal_and_slot(self):
+        block, self.index = divmod(self.nextDuel, counterBlockSize)
+        self.nextDuel += 1
+        if self.scalarBlock != block:
+            self.scalarBlock = block
+            self.scalarDuels = [numbers.tolist() for numbers in self.duel_block(block)]
+        duels = self.scalarDuels
+        return duels[0][self.index], duels[1][self.index]
+
+    def replicator(self):
+        return self.scalarDuels[2][self.index]
+
+    def shuffle_orders(self, focalsOrder, chosenOrder):
+        focalsOrder[:], chosenOrder[:] = self.scalarDuels[3][self.index]
+
+    def contact(self, index):
+        return self.scalarDuels[4][self.index][index]
+
+    # players and partner numbers of a reputation initialization duel
+    def rep_init_duel(self, partnerRange):
+        block, index = divmod(self.nextRepInitDuel, counterBlockSize)
+        self.nextRepInitDuel += 1
+        if self.repInitBlock != block:
+            self.repInitBlock = block
+            self.repInitDuels = (
+                self.generator(block, repInitPlayerPurpose)
+                .integers(0, self.n * self.n, counterBlockSize)
+                .tolist(),
+                self.generator(block, repInitPartnerPurpose)
+                .integers(0, partnerRange, counterBlockSize)
+                .tolist(),
+            )
+        return self.repInitDuels[0][index], self.repInitDuels[1][index]
+
+    # the players and partner numbers of the next count reputation initialization
+    # duels, for the batched engine
+    def rep_init_duels(self, count, partnerRange):
+        first = self.nextRepInitDuel
+        self.nextRepInitDuel += count
+        blocks = range(
+            first // counterBlockSize,
+            (first + max(count, 1) - 1) // counterBlockSize + 1,
+        )
+        start = first - blocks[0] * counterBlockSize
+        parts = [
+            (
+                self.generator(block, repInitPlayerPurpose).integers(
+                    0, self.n * self.n, counterBlockSize
+                ),
+                self.generator(block, repInitPartnerPurpose).integers(
+                    0, partnerRange, counterBlockSize
+                ),
+            )
+            for block in blocks
+        ]
+        return tuple(
+            np.concatenate(numbers)[start : start + count] for numbers in zip(*parts)
+        )
+
+    def rep_init_players(self):
+        p1, offset = self.rep_init_duel(self.n * self.n - 1)
+        return p1, (p1 + 1 + offset) % (self.n * self.n)
+
+    def rep_init_player_and_slot(self):
+        return self.rep_init_duel(8)
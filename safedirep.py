@@ -18,10 +18,18 @@
 
 import morals
 import numpy as np
+import misc_globals
+from games_and_strategies import cooperate
+from memmap_state import state_array
 
 againstPlayerBits = {}
 visualMatrix = {}
 
+# Flat views: againstPlayerBitsFlat[moral][p, k] is p's stored action of its k-th neighbor,
+# visualMatrixFlat[moral] is visualMatrix[moral] indexed by expanded flat index
+againstPlayerBitsFlat = {}
+visualMatrixFlat = {}
+
 initialAgainstPlayerAction = {
     morals.safedirep: -1,
     morals.safedirep2: -1,
@@ -31,23 +39,42 @@ initialAgainstPlayerAction = {
 def initSafedirep(moral, strategies):
     from config import N
 
-    againstPlayerBits[moral] = (
-        np.ones((N, N, 8), int) * initialAgainstPlayerAction[moral]
+    againstPlayerBits[moral] = state_array(
+        "againstPlayerBits-" + morals.moralNames[moral],
+        (N, N, 8),
+        misc_globals.stateInt,
+        initialAgainstPlayerAction[moral],
+    )
+    visualMatrix[moral] = state_array(
+        "visualMatrix-" + morals.moralNames[moral],
+        (3 * N, 3 * N),
+        misc_globals.stateInt,
+        -5,
     )
-    visualMatrix[moral] = np.zeros((3 * N, 3 * N), int) - 5
+    againstPlayerBitsFlat[moral] = againstPlayerBits[moral].reshape(N * N, 8)
+    visualMatrixFlat[moral] = visualMatrix[moral].reshape(-1)
     return morals.initSaferep(moral, strategies)
 
 
-def store_action(moral, victim, actor, action):
-    from implementation import neighbor_index, neighbor_offset
-    from games_and_strategies import cooperate
-
+# Store the action the actor (the actorSlot-th neighbor of victim) played against victim
+def store_action(moral, victim, actorSlot, action):
     # store for the actual game
-    nb = neighbor_index(victim, actor)
-    againstPlayerBits[moral][victim[0], victim[1], nb] = action
+    againstPlayerBitsFlat[moral][victim, actorSlot] = action
 
     # store for the visualization
-    off = neighbor_offset(actor, victim)
-    x = 3 * actor[0] + 1 + off[0]
-    y = 3 * actor[1] + 1 + off[1]
-    visualMatrix[moral][x, y] = 2 if action == cooperate else 3
+    actor = misc_globals.neighborLists[victim][actorSlot]
+    victimSlot = misc_globals.reverseSlotLists[victim][actorSlot]
+    visualMatrixFlat[moral][misc_globals.expandedIndexLists[actor][victimSlot]] = (
+        2 if action == cooperate else 3
+    )
+
+
+# store_action for arrays of victims, actor slots and actions
+def store_actions(moral, victims, actorSlots, actions):
+    againstPlayerBitsFlat[moral][victims, actorSlots] = actions
+
+    actors = misc_globals.neighborTable[victims, actorSlots]
+    victimSlots = misc_globals.reverseSlotTable[victims, actorSlots]
+    visualMatrixFlat[moral][misc_globals.expandedIndexTable[actors, victimSlots]] = (
+        np.where(actions == cooperate, 2, 3)
+    )
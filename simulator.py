@@ -0,0 +1,193 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import contextlib
+import importlib
+import io
+import os
+import sys
+import threading
+
+import numpy as np
+
+# Run simulations from Python: run_simulation(params) runs a simulation
+# without GUI and returns its final state and statistics in memory
+# (ensemble.py and sweep.py build on it; main.py is the command line version).
+# The simulator modules configure themselves from cmdline_args.args when they
+# are first imported (config sets up the initial state), so run_simulation
+# parses the arguments, sets them with cmdline_args.set_args and imports fresh
+# copies of the modules for every run. The modules of a run stay loaded (and
+# can be inspected) until the next run. Since the modules of a run are the
+# entries of sys.modules, run_simulation is not reentrant: runs in several
+# threads of a process take turns (see runLock), and a simulation cannot start
+# another one. Use processes (as ensemble.run_all does) to run simulations at
+# the same time.
+#
+# Example:
+#   import simulator
+#   result = simulator.run_simulation(
+#       {"N": 30, "M": 20000, "initial_strategies": "Mafia_Gandhi_RandomInit"}
+#   )
+#   print(result.strategyCounts)
+
+# Held while the functions of this module replace or read the simulator modules
+runLock = threading.RLock()
+
+# The directory of the simulator modules
+packageDirectory = os.path.dirname(os.path.abspath(__file__))
+
+
+# The final state and the statistics of a simulation
+class Result:
+    def __init__(self, modules):
+        misc_globals = modules["misc_globals"]
+        implementation = modules["implementation"]
+        statistics = modules["stats"]
+        strategyName = modules["games_and_strategies"].strategyName
+        moralNames = modules["morals"].moralNames
+
+        self.seed = misc_globals.seed
+        self.iterations = implementation.iteration
+        # why the simulation terminated early ("" if it ran all iterations)
+        self.terminationReason = implementation.terminationReason
+        # the final strategy of every player
+        self.strategies = misc_globals.strategies.copy()
+        # the final reputations of all players, by moral name
+        self.reputation = {
+            moralNames[moral]: reputation.copy()
+            for moral, reputation in misc_globals.reputation.items()
+        }
+        # the final number of players, by strategy name
+        self.strategyCounts = {
+            strategyName[strategy]: implementation.strategyCounts[strategy]
+            for strategy in misc_globals.occurringStrategiesNames
+        }
+        # the rows of the statistics files, by strategy name
+        self.statsColumns = statistics.columns()
+        self.stats = {
+            strategyName[strategy]: np.array(rows)
+            for strategy, rows in statistics.history.items()
+        }
+
+
+# Run a simulation; params is either a dict mapping the names of command line
+# options (as in the namespace of cmdline_args.args, e.g. "N" or
+# "initial_strategies") to values, or a list of command line arguments.
+# With store, the simulation also writes its output folder (configuration,
+# statistics and images, as from the command line).
+# Invalid or unsupported arguments raise a ValueError.
+def run_simulation(params, store=False):
+    with runLock:
+        if isinstance(params, dict):
+            params = to_arguments(params)
+        arguments = ["--no-gui"] + ([] if store else ["--no-stats"]) + list(params)
+
+        # check the arguments before importing the modules that set up the run
+        # (and may create folders or exit)
+        options = parse_arguments(arguments)
+        if options.replicas > 1:
+            raise ValueError("run_simulation does not support replicas")
+        if options.branches > 1:
+            raise ValueError("run_simulation does not support branches")
+        if options.store is not None:
+            raise ValueError("run_simulation does not support the result store")
+        if options.memmap_state:
+            raise ValueError("run_simulation does not support memory-mapped state")
+
+        use_arguments(arguments, options)
+        try:
+            implementation = importlib.import_module("implementation")
+        except SystemExit as exit:
+            # config rejected a value (and printed why)
+            raise ValueError(
+                "Invalid arguments (exit code %s)" % exit.code
+            ) from None
+
+        sys.modules["stats"].keepHistory = True
+        if store:
+            implementation.main()
+        else:
+            implementation.simulation(implementation.HeadlessUI())
+        return Result(sys.modules)
+
+
+# The namespace of the given command line arguments (see cmdline_args.parse);
+# raises a ValueError (with the message of the parser) if they are invalid
+def parse_arguments(arguments):
+    with runLock:
+        cmdline_args = importlib.import_module("cmdline_args")
+        errors = io.StringIO()
+        try:
+            with contextlib.redirect_stderr(errors):
+                return cmdline_args.parse(arguments)
+        except SystemExit:
+            message = errors.getvalue().strip().splitlines()[-1]
+            raise ValueError(message.split("error: ", 1)[-1]) from None
+
+
+# Forget the imported simulator modules and make the given arguments and their
+# namespace those of the simulator modules imported next (hold runLock until
+# the run using them is done)
+def use_arguments(arguments, options):
+    unload_simulator_modules()
+    importlib.import_module("cmdline_args").set_args(arguments, options)
+
+
+# The parameter lines determining the results (see
+# cmdline_args.result_parameter_lines) of a simulation run with the given
+# arguments by run_simulation: the normalized form of the arguments, the same
+# for all ways to give them
+def normalized_parameters(params):
+    with runLock:
+        if isinstance(params, dict):
+            params = to_arguments(params)
+        options = parse_arguments(["--no-gui", "--no-stats"] + list(params))
+        return sys.modules["cmdline_args"].result_parameter_lines(options)
+
+
+# The command line arguments setting the given options
+def to_arguments(params):
+    with runLock:
+        actions = importlib.import_module("cmdline_args").argParser._actions
+
+    unknown = set(params) - set(action.dest for action in actions)
+    if unknown:
+        raise ValueError("Unknown parameters: " + ", ".join(sorted(unknown)))
+    result = []
+    # in the order of the parser (which, e.g., needs N before the polarizing player)
+    for action in actions:
+        if action.dest not in params or not action.option_strings:
+            continue
+        value = params[action.dest]
+        if action.nargs == 0:
+            if value == action.const:
+                result.append(action.option_strings[-1])
+        elif value is not None:
+            result.extend([action.option_strings[-1], str(value)])
+    return result
+
+
+# Forget the imported simulator modules (except this one and the running script)
+def unload_simulator_modules():
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if (
+            name not in (__name__, "__main__")
+            and path is not None
+            and os.path.dirname(os.path.abspath(path)) == packageDirectory
+        ):
+            del sys.modules[name]
@@ -20,6 +20,7 @@ import strategies
 import morals
 import numpy as np
 import misc_globals
+from memmap_state import state_array
 
 unsafe = 0.5
 semisafe = 0.75
@@ -30,7 +31,9 @@ safe = 1.0
 def init_reputation(moral, strats):
     from misc_globals import N
 
-    rep = np.zeros((N,N), float)
+    rep = state_array(
+        "reputation-" + morals.moralNames[moral], (N, N), misc_globals.stateFloat
+    )
     rep[:] = (strats == strategies.smartMafia) * unsafe
     return rep
 
@@ -47,20 +50,34 @@ def get_reputation(r_judging, r_judged):
     else:
         return 1.0
 
+
+# get_reputation for arrays of reputations
+def get_reputations(r_judging, r_judged):
+    return np.where(
+        r_judged == 0.0,
+        0.0,
+        np.where(
+            r_judged == safe,
+            (r_judging == safe) * 1.0,
+            np.where(r_judged == semisafe, (r_judging >= semisafe) * 1.0, 1.0),
+        ),
+    )
+
 import misc_globals
 
 
 def update_reputation(me,moral,my_old_rep,her_old_rep,my_action):
-    from implementation import get_neighbors
+    strats = misc_globals.strategiesFlat
 
-    if misc_globals.strategies[me] == strategies.smartMafia:
+    if strats[me] == strategies.smartMafia:
         # a fellow family member!
-        neighbors = get_neighbors(me)
+        neighbors = misc_globals.neighborLists[me]
+        rep = misc_globals.reputationFlat[moral]
 
         newrep = safe
         for n in neighbors:
-            nrep = misc_globals.reputation[moral][n]
-            nstrat = misc_globals.strategies[n]
+            nrep = rep[n]
+            nstrat = strats[n]
 
             # if there is an enemy in sight, we are unsafe
             if nstrat != strategies.smartMafia:
@@ -71,3 +88,25 @@ def update_reputation(me,moral,my_old_rep,her_old_rep,my_action):
     else:
         # an enemy of the family
         return 0.0
+
+
+# update_reputation for an array of (distinct) players
+def update_reputations(me, moral, my_old_rep, her_old_rep, my_action):
+    strats = misc_globals.strategiesFlat
+    neighbors = misc_globals.neighborTable[me]
+    rep = misc_globals.reputationFlat[moral]
+
+    # a fellow family member is unsafe if there is an enemy in sight
+    newrep = np.where(
+        np.all(strats[neighbors] == strategies.smartMafia, axis=1),
+        np.where(np.any(rep[neighbors] < semisafe, axis=1), semisafe, safe),
+        unsafe,
+    )
+    # an enemy of the family
+    return np.where(strats[me] == strategies.smartMafia, newrep, 0.0)
+
+
+# Whether update_reputation leaves the reputations of the players unchanged
+def is_fixed_point(me, moral, my_old_rep, her_old_rep, my_action):
+    newrep = update_reputations(me, moral, my_old_rep, her_old_rep, my_action)
+    return newrep == my_old_rep
@@ -0,0 +1,117 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+import misc_globals
+import config
+import display_config
+import morals
+import safedirep
+import batched_engine
+import kinetic
+import implementation
+
+# Snapshots of the mutable state of a simulation. The kernels work on the
+# module-level arrays (which many modules import by name), so a simulation is
+# the state of its process: a StateSnapshot holds a copy of the arrays, and
+# restore() copies it back in place. This way one process can keep several
+# states of a simulation of the same configuration and switch between them, but
+# it cannot run two simulations at the same time. Besides the arrays changed
+# by duels, a snapshot comprises the strategy counts, the iteration, the states
+# of the random number generators, the duels pending in the batched engine and
+# the active pairs of the kinetic engine. A simulation continues after
+# restore() exactly as it would have from the snapshot, except with --rng
+# numpy, whose buffered random numbers are not captured (see
+# rng.BufferedRandom).
+
+# The per-moral state arrays changed by duels, by name
+moralStates = {
+    "reputation": misc_globals.reputation,
+    "saferepAgainstGoodBits": morals.saferepAgainstGoodBits,
+    "saferepAgainstBadBits": morals.saferepAgainstBadBits,
+    "kandoriHistory": morals.kandoriHistory,
+    "againstPlayerBits": safedirep.againstPlayerBits,
+    "visualMatrix": safedirep.visualMatrix,
+}
+
+
+# The arrays of the state changed by duels, by key (a name, or a name and a moral)
+def state_arrays():
+    arrays = {
+        "strategies": misc_globals.strategies,
+        "edgeActions": implementation.edgeActions,
+        "scores": implementation.scores,
+    }
+    if display_config.showLastActionMatrix:
+        arrays["lastAction"] = implementation.lastAction
+    for name, moralArrays in moralStates.items():
+        for moral, array in moralArrays.items():
+            arrays[name, moral] = array
+    return arrays
+
+
+# The generators whose states are part of the simulation state
+def random_generators():
+    generators = [
+        misc_globals.duelSelectionRandom,
+        misc_globals.reputationNoiseRandom,
+    ]
+    if config.counterBasedRandom:
+        generators.append(misc_globals.duelRandom)
+    return generators
+
+
+class StateSnapshot:
+    def __init__(self):
+        implementation.refresh_scores()
+        self.arrays = {key: array.copy() for key, array in state_arrays().items()}
+        self.currentWelfare = implementation.currentWelfare.copy()
+        self.strategyCounts = list(implementation.strategyCounts)
+        self.numberOfAliveStrategies = implementation.numberOfAliveStrategies
+        self.cachesValid = implementation.edgeActionsValid, implementation.scoresValid
+        self.iteration = implementation.iteration
+        self.pendingDuels = batched_engine.pendingDuels
+        self.randomStates = [rand.getstate() for rand in random_generators()]
+        self.batchedRandomState = misc_globals.batchedDuelRandom.bit_generator.state
+        self.numpyRandomState = np.random.get_state()
+        self.activity = [
+            kinetic.pairIsActive.copy(),
+            kinetic.activePairs[: kinetic.numberOfActivePairs].copy(),
+            kinetic.positionOfPair.copy(),
+            kinetic.playerIsUnstable.copy(),
+        ]
+
+    # Make this the current state of the simulation
+    def restore(self):
+        for key, array in state_arrays().items():
+            np.copyto(array, self.arrays[key])
+        implementation.currentWelfare = self.currentWelfare.copy()
+        implementation.strategyCounts[:] = self.strategyCounts
+        implementation.numberOfAliveStrategies = self.numberOfAliveStrategies
+        implementation.edgeActionsValid, implementation.scoresValid = self.cachesValid
+        implementation.iteration = self.iteration
+        batched_engine.pendingDuels = self.pendingDuels
+        for rand, state in zip(random_generators(), self.randomStates):
+            rand.setstate(state)
+        misc_globals.batchedDuelRandom.bit_generator.state = self.batchedRandomState
+        np.random.set_state(self.numpyRandomState)
+        np.copyto(kinetic.pairIsActive, self.activity[0])
+        kinetic.numberOfActivePairs = len(self.activity[1])
+        kinetic.activePairs[: kinetic.numberOfActivePairs] = self.activity[1]
+        np.copyto(kinetic.positionOfPair, self.activity[2])
+        np.copyto(kinetic.playerIsUnstable, self.activity[3])
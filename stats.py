@@ -43,6 +43,13 @@ perMoralStdevAbove = 4
 perMoralStdevBelow = 5
 perMoralNGood = 6
 perMoralNBad = 7
+perMoralStats = [
+    perMoralMean,
+    perMoralStdevAbove,
+    perMoralStdevBelow,
+    perMoralNGood,
+    perMoralNBad,
+]
 
 # Headers of columns in CSV file
 csvHeader = {
@@ -60,6 +67,11 @@ csvHeader = {
 csvFiles = {}
 csvSep = ";"
 
+# With keepHistory, the rows of the CSV files (see row) are also kept in memory,
+# history maps each strategy to the list of its rows
+keepHistory = False
+history = {}
+
 
 def updateCurrentStatistics(iteration):
     """Compute the statistics for all strategies and all interesting morals,
@@ -74,6 +86,8 @@ def updateCurrentStatistics(iteration):
     for strategy in occurringStrategiesNames.keys():
         current[strategy] = computeStats(strategy)
         current[strategy][iterations] = iteration
+        if keepHistory:
+            history.setdefault(strategy, []).append(row(strategy))
     if config.storeStats:
         storeCurrentStats()
 
@@ -92,7 +106,8 @@ def computeStats(strategy):
     n = np.sum(sel)
     repStats = {}
     for moral in occurringInterestingMorals:
-        rep = reputation[moral]
+        # in double precision, whatever the (compact) dtype of the reputations
+        rep = np.asarray(reputation[moral], float)
         avgRep = float(np.sum(rep * sel)) / n if n > 0 else 0
         selRepAbove = sel * (rep >= avgRep)
         selRepBelow = sel * (rep <= avgRep)
@@ -130,6 +145,30 @@ def computeStats(strategy):
     return res
 
 
+# The columns of the CSV files
+def columns():
+    result = [csvHeader[iterations], csvHeader[numberOfPlayers]]
+    for moral in occurringInterestingMorals:
+        name = morals.moralNames[moral]
+        for stat in perMoralStats:
+            result.append(name + csvHeader[stat])
+    if config.welfareStatistics:
+        result.append(csvHeader[welfareStats])
+    return result
+
+
+# The current statistics of strategy, as a row of its CSV file
+def row(strategy):
+    s = current[strategy]
+    result = [s[iterations], s[numberOfPlayers]]
+    for moral in occurringInterestingMorals:
+        r = s[reputationStats][moral]
+        result.extend(r[stat] for stat in perMoralStats)
+    if config.welfareStatistics:
+        result.append(s[welfareStats])
+    return result
+
+
 def prepareStoreStats(foldername):
     if not config.storeStats:
         return
@@ -143,28 +182,7 @@ def prepareStoreStats(foldername):
             "w",
         )
         csvFiles[strategy] = csvFile
-        csvFile.write(csvHeader[iterations] + csvSep + csvHeader[numberOfPlayers])
-        for moral in occurringInterestingMorals:
-            name = morals.moralNames[moral]
-            csvFile.write(
-                csvSep
-                + name
-                + csvHeader[perMoralMean]
-                + csvSep
-                + name
-                + csvHeader[perMoralStdevAbove]
-                + csvSep
-                + name
-                + csvHeader[perMoralStdevBelow]
-                + csvSep
-                + name
-                + csvHeader[perMoralNGood]
-                + csvSep
-                + name
-                + csvHeader[perMoralNBad]
-            )
-        if config.welfareStatistics:
-            csvFile.write(csvSep + csvHeader[welfareStats])
+        csvFile.write(csvSep.join(columns()))
         csvFile.write(os.linesep)
 
 
@@ -172,25 +190,8 @@ def storeCurrentStats():
     if not config.storeStats:
         return
     for strategy in occurringStrategiesNames.keys():
-        s = current[strategy]
         csvFile = csvFiles[strategy]
-        csvFile.write(str(s[iterations]) + csvSep + str(s[numberOfPlayers]))
-        for moral in occurringInterestingMorals:
-            r = s[reputationStats][moral]
-            csvFile.write(
-                csvSep
-                + str(r[perMoralMean])
-                + csvSep
-                + str(r[perMoralStdevAbove])
-                + csvSep
-                + str(r[perMoralStdevBelow])
-                + csvSep
-                + str(r[perMoralNGood])
-                + csvSep
-                + str(r[perMoralNBad])
-            )
-        if config.welfareStatistics:
-            csvFile.write(csvSep + str(s[welfareStats]))
+        csvFile.write(csvSep.join(str(value) for value in row(strategy)))
         csvFile.write(os.linesep)
         csvFile.flush()
 
@@ -51,10 +51,76 @@ def setup_circle(center_strategy):
     from cmdline_args import args
 
     s = args.s
-    for x in range(N):
-        for y in range(N):
-            if (x - N / 2.0) ** 2 + (y - N / 2.0) ** 2 < s**2:
-                strategies[x, y] = center_strategy
+    x, y = np.ogrid[:N, :N]
+    strategies[(x - N / 2.0) ** 2 + (y - N / 2.0) ** 2 < s**2] = center_strategy
+
+
+# Paint discs with the given centers and strategies one after another (later
+# discs cover earlier ones); the disc with center (rx, ry) covers the cells (x, y)
+# of the lattice with (x - rx) ** 2 + (y - ry) ** 2 < s ** 2.
+# Only the last disc covering a cell matters, so we look for it going through the
+# discs backwards in chunks, skipping the discs that have no cell left uncovered
+# by later discs within their blocks or the neighboring ones
+def paint_discs(centersX, centersY, discStrategies, s):
+    from misc_globals import strategies, N
+
+    reach = max(1, int(np.ceil(s)))
+    offsets = np.arange(-reach, reach + 1)
+    discs = len(centersX)
+    floorX = np.floor(centersX).astype(int)
+    floorY = np.floor(centersY).astype(int)
+
+    # the lattice is divided into blocks of reach x reach cells,
+    # so that a disc lies within the 3 x 3 blocks around its center
+    blocks = -(-N // reach)
+    blockX = floorX // reach
+    blockY = floorY // reach
+
+    # the last disc covering each cell (-1 if none)
+    lastDisc = np.full(N * N, -1)
+    chunkSize = max(1, (N * N) // (reach * reach))
+    end = discs
+    while end > 0:
+        uncovered = np.zeros((blocks * reach, blocks * reach), bool)
+        uncovered[:N, :N] = (lastDisc < 0).reshape(N, N)
+        uncoveredBlocks = uncovered.reshape(blocks, reach, blocks, reach).any(
+            axis=(1, 3)
+        )
+        if not np.any(uncoveredBlocks):
+            break
+        # whether any of the 3 x 3 blocks around block (bx, by) is uncovered
+        # (at index (bx + 1, by + 1))
+        nearUncovered = np.zeros((blocks + 2, blocks + 2), bool)
+        for i in range(3):
+            for j in range(3):
+                nearUncovered[i : i + blocks, j : j + blocks] |= uncoveredBlocks
+
+        start = max(0, end - chunkSize)
+        chunk = np.arange(start, end)
+        chunk = chunk[nearUncovered[blockX[chunk] + 1, blockY[chunk] + 1]]
+        end = start
+
+        # all discs of the chunk precede the discs that are already painted,
+        # so they only paint uncovered cells
+        ys = floorY[chunk, None] + offsets
+        yInside = (ys >= 0) & (ys < N)
+        dy2 = (ys - centersY[chunk, None]) ** 2
+        for dx in offsets:
+            xs = floorX[chunk] + dx
+            dx2 = (xs - centersX[chunk]) ** 2
+            inside = (
+                yInside
+                & ((xs >= 0) & (xs < N))[:, None]
+                & (dx2[:, None] + dy2 < s**2)
+            )
+            np.maximum.at(
+                lastDisc,
+                (xs[:, None] * N + ys)[inside],
+                np.broadcast_to(chunk[:, None], inside.shape)[inside],
+            )
+
+    covered = lastDisc >= 0
+    strategies.reshape(-1)[covered] = np.asarray(discStrategies)[lastDisc[covered]]
 
 
 def horizontal_split_strategies(upper_strategy, lower_strategy):
@@ -75,9 +141,7 @@ def diagonal_split_strategies(upper_strategy, lower_strategy):
     from misc_globals import strategies, N
 
     strategies[:] = upper_strategy
-    for x in range(N):
-        for y in range(x):
-            strategies[x, y] = lower_strategy
+    strategies[np.tril_indices(N, -1)] = lower_strategy
 
 
 def chess_board_strategies(strategy1, strategy2, field_size):
@@ -114,17 +178,16 @@ def chess_board_strategies(strategy1, strategy2, field_size):
 
 def probabilistic_diagonal_split(upper_strategy, lower_strategy):
     from cmdline_args import args
-    from misc_globals import initialStateRandom, bernoulli, strategies, N
+    from misc_globals import initialStateGenerator, strategies, N
 
     prob = args.prob_for_init
     drawStrategiesIid([lower_strategy, upper_strategy], [prob, 1 - prob])
-    for x in range(N):
-        for y in range(x):
-            strategies[x, y] = (
-                upper_strategy
-                if bernoulli(args.prob_for_init, initialStateRandom) == 1
-                else lower_strategy
-            )
+    lowerTriangle = np.tril_indices(N, -1)
+    strategies[lowerTriangle] = np.where(
+        initialStateGenerator.random(len(lowerTriangle[0])) <= prob,
+        upper_strategy,
+        lower_strategy,
+    )
 
 
 def cluster_strategy(fill_strategy, center_strategy):
@@ -156,55 +219,43 @@ def circle_strategy(fill_strategy, center_strategy):
 
 
 def drawStrategiesIid(strategiesToUse, strategyProbs):
-    from misc_globals import strategies, N
-    from scipy import stats
+    from misc_globals import initialStateGenerator, strategies, N
+
+    strategies[:] = initialStateGenerator.choice(
+        strategiesToUse, size=(N, N), p=strategyProbs
+    )
+
 
-    strategiesDistribution = stats.rv_discrete(
-        values=(strategiesToUse, strategyProbs), name="strategies-dist"
+# count discs of radius s at uniformly random centers, with strategies drawn
+# from strategiesToUse with the given probabilities
+def random_discs(count, strategiesToUse, strategyProbs, s):
+    from misc_globals import initialStateGenerator, N
+
+    discStrategies = initialStateGenerator.choice(
+        strategiesToUse, size=count, p=strategyProbs
     )
-    strategies[:] = strategiesDistribution.rvs(size=(N, N))
+    centersX = initialStateGenerator.uniform(0, N, count)
+    centersY = initialStateGenerator.uniform(0, N, count)
+    paint_discs(centersX, centersY, discStrategies, s)
 
 
 def random_strategy_clusters(strategiesToUse, strategyProbs):
-    from misc_globals import initialStateRandom, strategies, N
-    from scipy import stats
+    from misc_globals import strategies, N
     from cmdline_args import args
 
-    strategiesDistribution = stats.rv_discrete(
-        values=(strategiesToUse, strategyProbs), name="strategies-dist"
-    )
     s = args.s
     strategies[:] = strategiesToUse[0]
-    for _ in range(10 * (int(N / s)) ** 2):
-        strategy = strategiesDistribution.rvs()
-        rx = initialStateRandom.uniform(0, N)
-        ry = initialStateRandom.uniform(0, N)
-        for x in range(N):
-            for y in range(N):
-                if (x - rx) ** 2 + (y - ry) ** 2 < s**2:
-                    strategies[x, y] = strategy
+    random_discs(10 * (int(N / s)) ** 2, strategiesToUse, strategyProbs, s)
 
 
 def few_random_strategy_clusters(
     fillStrategy, nClusters, clusterStrategies, clusterStrategyProbs
 ):
-    from misc_globals import initialStateRandom, strategies, N
-    from scipy import stats
+    from misc_globals import strategies
     from cmdline_args import args
 
-    strategiesDistribution = stats.rv_discrete(
-        values=(clusterStrategies, clusterStrategyProbs), name="strategies-dist"
-    )
-    s = args.s
     strategies[:] = fillStrategy
-    for _ in range(nClusters):
-        strategy = strategiesDistribution.rvs()
-        rx = initialStateRandom.uniform(0, N)
-        ry = initialStateRandom.uniform(0, N)
-        for x in range(N):
-            for y in range(N):
-                if (x - rx) ** 2 + (y - ry) ** 2 < s**2:
-                    strategies[x, y] = strategy
+    random_discs(nClusters, clusterStrategies, clusterStrategyProbs, args.s)
 
 
 def random_strategies(strategy1, strategy2):
@@ -243,6 +294,73 @@ def custom_strategies():
         exec(args.initial_strategies_script)
 
 
+# Read the initial strategies from a .npy file (memory-mapped, so that only the
+# lattice is held in memory) or from a PNG image, whose pixel colors are mapped to
+# the strategies with that color in the strategy color map in use
+def strategies_from_file():
+    import misc_globals
+    from misc_globals import N
+    from cmdline_args import args
+
+    fileName = args.initial_strategies_file
+    try:
+        if fileName.lower().endswith(".png"):
+            layout = strategies_from_png(fileName)
+        else:
+            layout = np.load(fileName, mmap_mode="r", allow_pickle=False)
+    except (OSError, ValueError) as error:
+        print("Cannot read initial strategies from {}: {}".format(fileName, error))
+        exit(17)
+    if layout.shape != (N, N) or layout.dtype.kind not in "iu":
+        print(
+            "The initial strategies in {} must be an integer array of shape "
+            "({}, {}), not {} of shape {}".format(
+                fileName, N, N, layout.dtype, layout.shape
+            )
+        )
+        exit(17)
+    unknown = np.setdiff1d(np.unique(layout), list(strategies.strategyName))
+    if len(unknown) > 0:
+        print(
+            "The initial strategies in {} contain unknown strategies {}".format(
+                fileName, unknown.tolist()
+            )
+        )
+        exit(17)
+    np.copyto(misc_globals.strategies, layout, casting="unsafe")
+
+
+# Map the colors of a PNG image to the strategies of the strategy color map
+def strategies_from_png(fileName):
+    from matplotlib import colors, image
+    from display_config import strategyColor
+
+    pixels = image.imread(fileName)
+    if pixels.ndim != 3:
+        raise ValueError("not a color image")
+    if pixels.dtype.kind == "f":
+        pixels = np.round(pixels * 255)
+    pixels = pixels[:, :, :3].astype(np.uint32)
+    pixelColors = (pixels[:, :, 0] << 16) | (pixels[:, :, 1] << 8) | pixels[:, :, 2]
+
+    # strategies by color, None for colors shared by several strategies
+    colorStrategies = {}
+    for strategy, color in strategyColor.items():
+        rgb = np.round(np.array(colors.to_rgb(color)) * 255).astype(np.uint32)
+        key = int((rgb[0] << 16) | (rgb[1] << 8) | rgb[2])
+        colorStrategies[key] = None if key in colorStrategies else strategy
+
+    usedColors, layout = np.unique(pixelColors, return_inverse=True)
+    ids = np.empty(len(usedColors), int)
+    for i, key in enumerate(usedColors.tolist()):
+        if colorStrategies.get(key, -1) is None:
+            raise ValueError("color #{:06X} is used by several strategies".format(key))
+        if key not in colorStrategies:
+            raise ValueError("color #{:06X} is not a strategy color".format(key))
+        ids[i] = colorStrategies[key]
+    return ids[layout.reshape(pixelColors.shape)]
+
+
 import strategies
 from strategies import (
     allDefect,
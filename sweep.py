@@ -0,0 +1,219 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+
+import simulator
+from ensemble import csvSep, run_all
+
+# Sweep a grid of parameters, spread over worker processes:
+#   python sweep.py --grid U=0.5,0.6 --grid s=4,8,16 --seeds 0 10 \
+#       [--jobs J] [--cache folder] [-o sweep.csv] -- <simulator options>
+# Every combination of the grid values (option names as in main.py, without
+# the leading dashes and with underscores) and seeds is a run with the given
+# simulator options. The summary of each run is stored in the cache folder,
+# under the hash of its normalized parameters (the parameter lines that
+# config.store_configuration writes, see simulator.normalized_parameters), and
+# runs found there are not repeated: an interrupted or extended sweep only
+# computes the missing runs. The summaries of all runs of the grid are
+# collected in one CSV file.
+
+argParser = argparse.ArgumentParser(
+    description="Sweep a grid of parameters of the RepEvol simulator",
+    epilog="All arguments after -- are passed to every run (see main.py -h).",
+)
+argParser.add_argument(
+    "--grid",
+    action="append",
+    default=[],
+    metavar="name=value,value,...",
+    help="The values of a parameter, e.g. U=0.5,0.6 or heaven_prob=0.1,0.2 "
+    + "(can be given several times)",
+)
+argParser.add_argument(
+    "--seeds",
+    nargs=2,
+    type=int,
+    default=[0, 1],
+    metavar=("first", "end"),
+    help="Run the seeds first, ..., end - 1 for each grid point (default: 0 1)",
+)
+argParser.add_argument(
+    "--jobs",
+    default=os.cpu_count(),
+    type=int,
+    metavar="int",
+    help="The number of worker processes (default: the number of CPUs)",
+)
+argParser.add_argument(
+    "--cache",
+    default=".sweep-cache",
+    metavar="folder",
+    help="The folder of the cached run summaries (default: %(default)s)",
+)
+argParser.add_argument(
+    "-o",
+    "--output",
+    default="sweep.csv",
+    metavar="file",
+    help="The CSV file summarizing the sweep (default: %(default)s)",
+)
+
+
+# The grid points: a list of (name, value) pairs per point
+def expand_grid(specs):
+    names = []
+    values = []
+    for spec in specs:
+        name, _, valueList = spec.partition("=")
+        if not valueList:
+            print("Invalid grid specification " + spec + "!")
+            sys.exit(1)
+        names.append(name)
+        values.append(valueList.split(","))
+    return [list(zip(names, point)) for point in itertools.product(*values)]
+
+
+# The version of the simulator sources (as in the result store), so that
+# cached runs are recomputed when the code changes
+def source_version():
+    arguments = ["--no-gui", "--no-stats"]
+    with simulator.runLock:
+        simulator.use_arguments(arguments, simulator.parse_arguments(arguments))
+        return importlib.import_module("result_store").source_version()
+
+
+# The cache key of a run with the given arguments
+def cache_key(arguments, sourceVersion):
+    parameters = simulator.normalized_parameters(arguments)
+    parameters.append("source version = " + sourceVersion)
+    return hashlib.sha256("\n".join(parameters).encode()).hexdigest()
+
+
+# Run the simulation with the given arguments (silently) and store its summary
+# in the given cache file (as soon as it is done, via a temporary file so that
+# an interrupted sweep leaves no partial summaries)
+def run_point(arguments, cacheFileName):
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        result = simulator.run_simulation(arguments)
+    summary = {
+        "seed": result.seed,
+        "iterations": result.iterations,
+        "terminationReason": result.terminationReason,
+        "strategyCounts": result.strategyCounts,
+    }
+    with open(cacheFileName + ".tmp", "w") as cacheFile:
+        json.dump(summary, cacheFile)
+    os.replace(cacheFileName + ".tmp", cacheFileName)
+
+
+def store_summary(filename, gridNames, points, summaries):
+    strategyNames = []
+    for summary in summaries:
+        strategyNames += [
+            name for name in summary["strategyCounts"] if name not in strategyNames
+        ]
+    summaryFile = open(filename, "w")
+    summaryFile.write(
+        csvSep.join(
+            gridNames
+            + ["Seed", "#iterations", "Termination"]
+            + ["#players " + name for name in strategyNames]
+        )
+        + os.linesep
+    )
+    for (point, _), summary in zip(points, summaries):
+        summaryFile.write(
+            csvSep.join(
+                [value for _, value in point]
+                + [
+                    str(summary["seed"]),
+                    str(summary["iterations"]),
+                    summary["terminationReason"],
+                ]
+                + [
+                    str(summary["strategyCounts"].get(name, 0))
+                    for name in strategyNames
+                ]
+            )
+            + os.linesep
+        )
+    summaryFile.close()
+
+
+def main(argv):
+    if "--" in argv:
+        baseArguments = argv[argv.index("--") + 1 :]
+        argv = argv[: argv.index("--")]
+    else:
+        baseArguments = []
+    args = argParser.parse_args(argv)
+    if args.jobs < 1:
+        print("The number of jobs must be positive!")
+        sys.exit(1)
+    if args.seeds[0] >= args.seeds[1]:
+        print("The range of seeds must not be empty!")
+        sys.exit(1)
+    os.makedirs(args.cache, exist_ok=True)
+
+    # the runs (grid point and seed) with their arguments and cache files
+    points = []
+    for point in expand_grid(args.grid):
+        try:
+            pointArguments = baseArguments + simulator.to_arguments(dict(point))
+        except ValueError as error:
+            print(error)
+            sys.exit(1)
+        for seed in range(*args.seeds):
+            points.append((point, pointArguments + ["--seed", str(seed)]))
+    sourceVersion = source_version()
+    try:
+        cacheFiles = [
+            os.path.join(args.cache, cache_key(arguments, sourceVersion) + ".json")
+            for _, arguments in points
+        ]
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+
+    missing = [
+        (arguments, cacheFileName)
+        for (_, arguments), cacheFileName in zip(points, cacheFiles)
+        if not os.path.exists(cacheFileName)
+    ]
+    print(
+        "%d of %d runs are cached, computing %d"
+        % (len(points) - len(missing), len(points), len(missing))
+    )
+    run_all(run_point, missing, args.jobs)
+
+    summaries = []
+    for cacheFileName in cacheFiles:
+        with open(cacheFileName) as cacheFile:
+            summaries.append(json.load(cacheFile))
+    store_summary(args.output, [name for name, _ in points[0][0]], points, summaries)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,148 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+from games_and_strategies import actionTable, replicatorUpdateMaxScore, cooperate
+from misc_globals import (
+    N,
+    strategiesFlat,
+    reputationFlat,
+    neighborTable,
+    expandedIndexTable,
+    expandedCenterIndex,
+    occurringMorals,
+    batchedDuelRandom,
+)
+
+import config
+import display_config
+import safedirep
+import batched_engine
+import implementation
+
+# Synchronous updating: in every generation, all players play against all
+# their neighbors, compare their score with that of a random neighbor and
+# apply the replicator rule, all at the same time (based on the strategies of
+# the previous generation). Then every player replays its duels of the
+# generation (in random order, plus contacts with heaven and hell) to update
+# its reputation. A generation counts as N * N iterations, and only whole
+# generations are played (as many as fit into M iterations).
+# As in the asynchronous scheme, the contacts with heaven and hell depend on
+# the role in the duel: every player is a focal once per generation (with the
+# focal contact probabilities) and a chosen neighbor as often as it was picked
+# (with the chosen ones); its replay contains a contact if any of these has one.
+
+players = np.arange(N * N)
+slotsOfPlayers = np.tile(np.arange(8), (N * N, 1))
+
+
+# Play one generation; returns the number of iterations (N * N)
+# and the number of players that changed their strategy
+def run_generation():
+    rand = batchedDuelRandom
+
+    # the actions played in this generation
+    actions = np.zeros((N * N, 10), np.int8)
+    actions[:, :8] = implementation.edgeActionsFlat
+    vsActions = implementation.edgeActionsByEdge[implementation.reverseEdgeTable]
+
+    # Store actions in lastAction
+    if display_config.showLastActionMatrix:
+        implementation.lastActionFlat[expandedIndexTable] = actions[:, :8]
+
+    # (Potential) strategy updates, all based on the scores of this generation
+    chosens = neighborTable[players, rand.integers(0, 8, N * N)]
+    implementation.refresh_scores()
+    scores = implementation.scoresFlat
+    diff = scores[chosens] - scores
+    if config.deterministicStrategyUpdates:
+        probForChosen = (diff > 0) * 1.0
+    else:
+        probForChosen = np.where(diff <= 0, 0, diff) / replicatorUpdateMaxScore
+    newStrategies = strategiesFlat[chosens]
+    takeover = (
+        (probForChosen > 0)
+        & (rand.random(N * N) <= probForChosen)
+        & (strategiesFlat != newStrategies)
+    )
+    strategiesFlat[takeover] = newStrategies[takeover]
+
+    # with a certain probability, players additionally meet heaven/hell
+    meetsHeaven = meetsHell = np.zeros(N * N, bool)
+    if config.supernaturalMode:
+        timesChosen = np.bincount(chosens, minlength=N * N)
+        meetsHeaven = contacts(
+            rand,
+            timesChosen,
+            config.heavenContactProbFocal,
+            config.heavenContactProbChosen,
+        )
+        if config.heavenHellTogether:
+            meetsHell = meetsHeaven
+        else:
+            meetsHell = contacts(
+                rand,
+                timesChosen,
+                config.hellContactProbFocal,
+                config.hellContactProbChosen,
+            )
+
+    # actions against heaven and hell (played with the possibly updated strategy)
+    strategyActions = actionTable[strategiesFlat]
+    actions[:, batched_engine.heavenSlot] = strategyActions[:, 1]
+    actions[:, batched_engine.hellSlot] = strategyActions[:, 0]
+
+    # reputation update: 'simulate' the played duels in random order
+    orders = rand.permuted(slotsOfPlayers, axis=1)
+    for moral in occurringMorals:
+        newReputations = batched_engine.replay_duels(
+            moral,
+            players,
+            reputationFlat[moral].copy(),
+            actions,
+            orders,
+            meetsHeaven,
+            meetsHell,
+        )
+        reputationFlat[moral][:] = newReputations
+        if moral in safedirep.againstPlayerBits:
+            safedirep.visualMatrixFlat[moral][expandedCenterIndex] = newReputations
+            store_played_actions(moral, actions, vsActions)
+
+    implementation.compute_caches()
+    return N * N, int(np.count_nonzero(takeover))
+
+
+# Whether the players have a contact (with heaven or hell) in this generation,
+# as focal (with probability probFocal) or in any of the timesChosen duels as
+# chosen neighbor (with probability probChosen each)
+def contacts(rand, timesChosen, probFocal, probChosen):
+    noContact = (1 - probFocal) * (1 - probChosen) ** timesChosen
+    return rand.random(N * N) >= noContact
+
+
+# Remember the actions played in this generation for direct reciprocity;
+# every player played against all neighbors, so this is safedirep.store_actions
+# for all edges (edges to the polarizing player are stored from its side)
+def store_played_actions(moral, actions, vsActions):
+    safedirep.againstPlayerBitsFlat[moral][:] = vsActions
+
+    # the visualization shows the action of each player against each neighbor
+    safedirep.visualMatrixFlat[moral][expandedIndexTable] = np.where(
+        actions[:, :8] == cooperate, 2, 3
+    )
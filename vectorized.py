@@ -0,0 +1,104 @@
+# Copyright 2023 Phillip Keldenich (TU Braunschweig); Sebastian Wild (University of Liverpool)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software 
+# and associated documentation files (the “Software”), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software 
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or 
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING 
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND 
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, 
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, 
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+
+from games_and_strategies import actionTable, moralTable, cooperate
+from misc_globals import (
+    N,
+    reputationFlat,
+    occurringMorals,
+    player_index,
+    slotOfOffset,
+)
+
+import misc_globals
+import config
+import morals
+import safedirep
+import smart_mafia
+
+# Vectorized versions of the reputation and action lookups of implementation,
+# evaluated for whole arrays of players at once.
+# The strategies and the neighbor tables are looked up in misc_globals when
+# called, such that the replica engine can substitute the stacked state of all
+# replicas (where player p of replica r has the flat index r * N * N + p).
+
+# The polarizing player (as flat index)
+polarizingPlayer = (
+    None if config.polarizingPlayer is None else player_index(*config.polarizingPlayer)
+)
+
+
+# The reputations of judged in the eyes of judging (see implementation.get_reputation);
+# judged[i] is the slots[i]-th neighbor of judging[i]
+def get_reputations(moral, judged, judging, slots):
+    rep = reputationFlat[moral]
+    if moral == morals.smartMafia:
+        result = smart_mafia.get_reputations(rep[judging], rep[judged])
+    else:
+        result = rep[judged]
+
+        # handle morals with direct reciprocity
+        if moral in safedirep.againstPlayerBits:
+            lastActions = safedirep.againstPlayerBitsFlat[moral][judging, slots]
+            seen = (result < 0.5) & (lastActions != -1)
+            result = np.where(seen, (lastActions == cooperate) * 1, result)
+
+    # the polarizing player is seen as bad by some and good by others
+    if polarizingPlayer is not None:
+        result = np.where(
+            judged % (N * N) == polarizingPlayer,
+            0 if moral in morals.polarizationSeedScepticMorals else 1,
+            result,
+        )
+    return result
+
+
+# The actions of players against their slots-th neighbors
+# (or against judged, if given; see duel_without_strategy_update)
+def get_actions(players, slots, judged=None):
+    if judged is None:
+        judged = misc_globals.neighborTable[players, slots]
+    strategy = misc_globals.strategiesFlat[players]
+    moral = moralTable[strategy]
+    repBits = np.zeros(len(players), int)
+    for someMoral in occurringMorals:
+        judging = moral == someMoral
+        if np.any(judging):
+            repBits[judging] = (
+                get_reputations(
+                    someMoral,
+                    judged[judging],
+                    players[judging],
+                    slots[judging],
+                )
+                >= 0.5
+            )
+    return actionTable[strategy, repBits]
+
+
+# The slots of neighbors in the neighbor lists of players, see
+# implementation.neighbor_index (also defined for players that are not neighbors)
+def neighbor_slots(players, neighbors):
+    px, py = np.divmod(players % (N * N), N)
+    nx, ny = np.divmod(neighbors % (N * N), N)
+    diffx = nx - px
+    diffy = ny - py
+    diffx = np.where(diffx > 1, -1, np.where(diffx < -1, 1, diffx))
+    diffy = np.where(diffy > 1, -1, np.where(diffy < -1, 1, diffy))
+    return slotOfOffset[diffx + 1, diffy + 1]